@@ -0,0 +1,197 @@
+"""
+Асинхронные представления для ASGI (foodgram.asgi, ASYNC_API=True).
+Добавление и удаление избранного, корзины и подписок, а также списки
+тегов и ингредиентов обслуживаются без занятого на весь запрос потока:
+обращения к базе данных идут через асинхронный ORM Django.
+Аутентификация, права, ошибки и заголовки — методы тех же представлений
+DRF из api.views, поэтому ответы совпадают с ними (см. api/tests.py);
+запросы других методов и браузерной версии API передаются им целиком.
+"""
+import functools
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Prefetch, QuerySet
+from django.http import HttpResponseBase
+from django.utils.cache import get_conditional_response
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from recipes.catalog import CATALOG_VERSION_KEY, catalog_cache_timeout
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import FoodgramUser, Subscription
+
+from .mixins import CATALOG_CACHE_TIMEOUT, catalog_cache_key, catalog_etag
+from .representations import short_recipe_data, subscription_data
+from .toggles import add_relation
+from .views import (FavoriteView, IngredientViewSet, ShoppingCartView,
+                    SubscribeView, TagViewSet)
+
+
+def get_api_view(fallback, request, *args, **kwargs):
+    """ Экземпляр представления DRF, как его создаёт as_view(). """
+    view = fallback.cls(**fallback.initkwargs)
+    actions = getattr(fallback, 'actions', None)
+    if actions is not None:
+        view.action_map = actions
+        for method, action in actions.items():
+            setattr(view, method, getattr(view, action))
+    view.setup(request, *args, **kwargs)
+    return view
+
+
+def async_api_view(fallback, methods):
+    """
+    Асинхронное представление поверх представления DRF fallback.
+    Согласование формата, аутентификация, права, ограничение частоты,
+    обработка ошибок и заголовки ответа — методы того же APIView, что
+    и в APIView.dispatch. Обработчик получает экземпляр представления
+    и запрос DRF и возвращает пару (данные, код ответа) или ответ.
+    Прочие методы и форматы, кроме JSON, обслуживает само fallback.
+    """
+    sync_fallback = sync_to_async(fallback)
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def view(request, *args, **kwargs):
+            if request.method not in methods:
+                return await sync_fallback(request, *args, **kwargs)
+            api_view = get_api_view(fallback, request, *args, **kwargs)
+            drf_request = api_view.initialize_request(
+                request, *args, **kwargs)
+            api_view.request = drf_request
+            api_view.headers = api_view.default_response_headers
+            api_view.format_kwarg = api_view.get_format_suffix(**kwargs)
+            try:
+                renderer, _ = api_view.perform_content_negotiation(
+                    drf_request)
+            except exceptions.NotAcceptable:
+                renderer = None
+            if not isinstance(renderer, JSONRenderer):
+                return await sync_fallback(request, *args, **kwargs)
+            try:
+                await sync_to_async(api_view.initial)(
+                    drf_request, *args, **kwargs)
+                response = await handler(api_view, drf_request,
+                                         *args, **kwargs)
+                if not isinstance(response, HttpResponseBase):
+                    response = Response(*response)
+            except Exception as exc:
+                response = api_view.handle_exception(exc)
+            response = api_view.finalize_response(
+                drf_request, response, *args, **kwargs)
+            if isinstance(response, Response):
+                response.render()
+            return response
+
+        # Аналог csrf_exempt: декоратор Django 4.2 превратил бы
+        # представление в синхронное.
+        view.csrf_exempt = True
+        return view
+
+    return decorator
+
+
+async def get_recipe(id):
+    return await Recipe.objects.defer('search_vector').filter(
+        pk=id).afirst()
+
+
+async def add_recipe(request, model, id, missing):
+    """ Добавление рецепта в избранное или корзину. """
+    recipe = await get_recipe(id)
+    if recipe is None:
+        if missing == status.HTTP_404_NOT_FOUND:
+            raise exceptions.NotFound()
+        return None, missing
+    if await sync_to_async(add_relation)(
+            model, user=request.user, recipe=recipe) is None:
+        return None, status.HTTP_400_BAD_REQUEST
+    return short_recipe_data(recipe, request), status.HTTP_201_CREATED
+
+
+async def remove(request, model, field, related_model, pk):
+    """ Удаление отметки; 404, если нет и самого объекта. """
+    deleted, _ = await model.objects.filter(
+        user=request.user, **{field: pk}).adelete()
+    if deleted:
+        return None, status.HTTP_204_NO_CONTENT
+    if not await related_model.objects.filter(pk=pk).aexists():
+        raise exceptions.NotFound()
+    return None, status.HTTP_400_BAD_REQUEST
+
+
+@async_api_view(FavoriteView.as_view(), ('POST', 'DELETE'))
+async def favorite(view, request, id):
+    if request.method == 'POST':
+        return await add_recipe(
+            request, Favorite, id, status.HTTP_400_BAD_REQUEST)
+    return await remove(request, Favorite, 'recipe_id', Recipe, id)
+
+
+@async_api_view(ShoppingCartView.as_view(), ('POST', 'DELETE'))
+async def shopping_cart(view, request, id):
+    if request.method == 'POST':
+        return await add_recipe(
+            request, ShoppingCart, id, status.HTTP_404_NOT_FOUND)
+    return await remove(
+        request, ShoppingCart, 'recipe_id', Recipe, id)
+
+
+@async_api_view(SubscribeView.as_view(), ('POST', 'DELETE'))
+async def subscribe(view, request, id):
+    if request.method == 'DELETE':
+        return await remove(
+            request, Subscription, 'author_id', FoodgramUser, id)
+    recipes = Recipe.objects.defer('search_vector')
+    limit = request.query_params.get('recipes_limit')
+    if limit:
+        recipes = recipes[:int(limit)]
+    author = await FoodgramUser.objects.prefetch_related(
+        Prefetch('recipes', queryset=recipes, to_attr='recipes_preview')
+    ).filter(pk=id).afirst()
+    if author is None or await sync_to_async(add_relation)(
+            Subscription, user=request.user, author=author) is None:
+        return None, status.HTTP_400_BAD_REQUEST
+    author.is_subscribed = True
+    return subscription_data(author, request), status.HTTP_201_CREATED
+
+
+async def catalog_list(view, request):
+    """
+    Список справочника через кэш CatalogCacheMixin: те же ключи и ETag,
+    при промахе — фильтры представления и асинхронная выборка.
+    """
+    version = await cache.aget_or_set(
+        CATALOG_VERSION_KEY, time.time_ns, timeout=None)
+    key = catalog_cache_key(
+        request.path, sorted(request.query_params.lists()),
+        request.accepted_renderer.format, version)
+    cached = await cache.aget(key)
+    if cached is None:
+        objects = await sync_to_async(view.filter_queryset)(
+            view.get_queryset())
+        if isinstance(objects, QuerySet):
+            objects = [obj async for obj in objects]
+        data = view.get_serializer(objects, many=True).data
+        cached = (catalog_etag(key, data), data)
+        await cache.aset(
+            key, cached, catalog_cache_timeout(CATALOG_CACHE_TIMEOUT))
+    etag, data = cached
+    response = Response(data, headers={'ETag': etag})
+    return get_conditional_response(
+        request, etag=etag, response=response) or response
+
+
+@async_api_view(TagViewSet.as_view({'get': 'list'}, suffix='List'),
+                ('GET',))
+async def tag_list(view, request):
+    return await catalog_list(view, request)
+
+
+@async_api_view(IngredientViewSet.as_view({'get': 'list'}, suffix='List'),
+                ('GET',))
+async def ingredient_list(view, request):
+    return await catalog_list(view, request)
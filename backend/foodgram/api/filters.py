@@ -1,28 +1,50 @@
 from django_filters import rest_framework as filter
 from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe, Tag
+from recipes.models import Recipe
+from recipes.search import search_recipes
+from recipes.tags import filter_by_tags
+
+from .indexes import get_ingredient_index, get_tag_ids
 
 
 class IngredientFilter(SearchFilter):
+    """
+    Поиск ингредиентов по началу названия.
+    Список отдаётся из индекса в памяти процесса,
+    остальные действия фильтруются через базу данных.
+    """
+
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or getattr(view, 'action', None) != 'list':
+            return super().filter_queryset(request, queryset, view)
+        return get_ingredient_index().search(terms)
+
 
 class RecipeFilter(filter.FilterSet):
     author = filter.CharFilter()
-    tags = filter.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        queryset=Tag.objects.all(),
+    tags = filter.MultipleChoiceFilter(
+        choices=lambda: [(slug, slug) for slug in get_tag_ids()],
         label='Tags',
-        to_field_name='slug'
+        method='get_tags'
     )
     is_favorited = filter.BooleanFilter(method='get_favorite')
     is_in_shopping_cart = filter.BooleanFilter(
         method='get_is_in_shopping_cart')
+    search = filter.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
+
+    def get_tags(self, queryset, name, value):
+        tag_ids = get_tag_ids()
+        return filter_by_tags(
+            queryset, [tag_ids[slug] for slug in value if slug in tag_ids])
 
     def get_favorite(self, queryset, name, value):
         if value:
@@ -32,4 +54,7 @@ class RecipeFilter(filter.FilterSet):
     def get_is_in_shopping_cart(self, queryset, name, value):
         if value:
             return queryset.filter(shopping_cart__user=self.request.user)
-        return queryset
\ No newline at end of file
+        return queryset
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
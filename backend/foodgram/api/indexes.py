@@ -0,0 +1,82 @@
+import bisect
+import threading
+import time
+
+from recipes.catalog import catalog_cache_timeout, get_catalog_version
+from recipes.models import Ingredient, Tag
+
+_lock = threading.Lock()
+_index = None
+_tag_ids = None
+
+
+class IngredientIndex:
+    """
+    Отсортированный массив названий ингредиентов.
+    Поиск по началу названия без учёта регистра выполняется
+    двоичным поиском, без обращения к базе данных.
+    """
+
+    def __init__(self, rows, version=None):
+        rows = sorted(rows, key=lambda row: (row['name'].upper(), row['id']))
+        self.keys = [row['name'].upper() for row in rows]
+        self.rows = rows
+        self.version = version
+        self.built = time.monotonic()
+
+    @classmethod
+    def build(cls, version=None):
+        rows = Ingredient.objects.values('id', 'name', 'measurement_unit')
+        return cls(list(rows), version)
+
+    def startswith(self, prefix):
+        prefix = prefix.upper()
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\U0010ffff', start)
+        return sorted(self.rows[start:end], key=lambda row: row['id'])
+
+    def search(self, terms):
+        """
+        Ингредиенты, название которых начинается с каждого из terms,
+        в порядке id — как у SearchFilter с search_fields = ['^name'].
+        """
+        longest = max(terms, key=len)
+        if not all(longest.upper().startswith(term.upper())
+                   for term in terms):
+            return []
+        return self.startswith(longest)
+
+
+def is_stale(built_version, built, version):
+    """
+    Построен ли индекс по другой версии справочников или раньше,
+    чем позволяет recipes.catalog.catalog_cache_timeout.
+    """
+    timeout = catalog_cache_timeout()
+    return built_version != version or (
+        timeout is not None and time.monotonic() - built >= timeout)
+
+
+def get_ingredient_index():
+    """ Индекс текущего процесса, перестраивается при смене версии. """
+    global _index
+    version = get_catalog_version()
+    index = _index
+    if index is None or is_stale(index.version, index.built, version):
+        with _lock:
+            if _index is None or is_stale(
+                    _index.version, _index.built, version):
+                _index = IngredientIndex.build(version)
+            index = _index
+    return index
+
+
+def get_tag_ids():
+    """ Соответствие slug → id тегов, перестраивается при смене версии. """
+    global _tag_ids
+    version = get_catalog_version()
+    tag_ids = _tag_ids
+    if tag_ids is None or is_stale(*tag_ids[:2], version):
+        tag_ids = _tag_ids = (version, time.monotonic(), dict(
+            Tag.objects.exclude(slug=None).values_list('slug', 'id')))
+    return tag_ids[2]
@@ -0,0 +1,159 @@
+import asyncio
+import importlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import clear_url_caches
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart
+from users.models import FoodgramUser, Subscription
+
+
+def use_urls(async_api):
+    """ Пересобирает маршруты API для выбранного режима. """
+    import api.urls
+    import foodgram.urls
+    with override_settings(ASYNC_API=async_api):
+        importlib.reload(api.urls)
+        importlib.reload(foodgram.urls)
+    clear_url_caches()
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает число запросов в секунду и задержку p99 '
+            'синхронных представлений (WSGI) и асинхронных (ASGI).')
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200,
+                            help="requests per endpoint")
+        parser.add_argument("--concurrency", type=int, default=20,
+                            help="number of concurrent clients")
+
+    def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        scenarios = self.get_scenarios(concurrency, options["requests"])
+        if scenarios is None:
+            self.stderr.write(
+                'Нужны хотя бы два пользователя, рецепт и ингредиент.')
+            return
+        for title, mode in (('WSGI', self.run_sync),
+                            ('ASGI', self.run_async)):
+            use_urls(title == 'ASGI')
+            for name, workers in scenarios:
+                started = time.perf_counter()
+                results = mode(workers)
+                elapsed = time.perf_counter() - started
+                latencies = [latency for latency, _ in results]
+                errors = sum(code >= 500 for _, code in results)
+                self.stdout.write(
+                    f'{title} {name}: {len(results) / elapsed:.0f} rps, '
+                    f'p50 {percentile(latencies, 50) * 1000:.1f} мс, '
+                    f'p99 {percentile(latencies, 99) * 1000:.1f} мс, '
+                    f'ошибок {errors}'
+                )
+        use_urls(False)
+
+    def get_scenarios(self, concurrency, requests):
+        """
+        Для каждого конечного адреса — по списку запросов на клиента.
+        Переключатели выполняются парами «добавить, удалить» над своей
+        парой пользователь-объект у каждого клиента, поэтому состояние
+        базы данных после замера не меняется.
+        """
+        users = list(FoodgramUser.objects.order_by('id')[:concurrency])
+        recipes = list(Recipe.objects.values_list('id', flat=True)[:100])
+        ingredient = Ingredient.objects.order_by('id').first()
+        if len(users) < 2 or not recipes or ingredient is None:
+            return None
+        tokens = {
+            user.id: Token.objects.get_or_create(user=user)[0].key
+            for user in users
+        }
+        rounds = max(1, requests // concurrency)
+
+        def free_pairs(model, field, ids):
+            taken = set(model.objects.values_list('user_id', field))
+            return (
+                (user.id, pk) for user in users for pk in ids
+                if (user.id, pk) not in taken
+                and not (model is Subscription and user.id == pk)
+            )
+
+        def toggles(url, pairs):
+            workers = []
+            for user_id, pk in islice(pairs, concurrency):
+                path = url.format(pk)
+                workers.append([
+                    (method, path, tokens[user_id])
+                    for _ in range(max(1, rounds // 2))
+                    for method in ('post', 'delete')
+                ])
+            return workers
+
+        def reads(path):
+            return [[('get', path, None)] * rounds
+                    for _ in range(concurrency)]
+
+        return [
+            ('tags', reads('/api/tags/')),
+            ('ingredients', reads(
+                f'/api/ingredients/?name={ingredient.name[:2]}')),
+            ('favorite', toggles(
+                '/api/recipes/{}/favorite/',
+                free_pairs(Favorite, 'recipe_id', recipes))),
+            ('shopping_cart', toggles(
+                '/api/recipes/{}/shopping_cart/',
+                free_pairs(ShoppingCart, 'recipe_id', recipes))),
+            ('subscribe', toggles(
+                '/api/users/{}/subscribe/',
+                free_pairs(Subscription, 'author_id', list(tokens)))),
+        ]
+
+    @staticmethod
+    def headers(token):
+        return {'Authorization': f'Token {token}'} if token else {}
+
+    def run_sync(self, workers):
+        def run(worker):
+            client = Client(raise_request_exception=False)
+            results = []
+            for method, path, token in worker:
+                started = time.perf_counter()
+                response = getattr(client, method)(
+                    path, headers=self.headers(token))
+                results.append(
+                    (time.perf_counter() - started, response.status_code))
+            connections.close_all()
+            return results
+
+        with ThreadPoolExecutor(len(workers)) as executor:
+            return [result for results in executor.map(run, workers)
+                    for result in results]
+
+    def run_async(self, workers):
+        async def run(worker):
+            client = AsyncClient(raise_request_exception=False)
+            results = []
+            for method, path, token in worker:
+                started = time.perf_counter()
+                response = await getattr(client, method)(
+                    path, headers=self.headers(token))
+                results.append(
+                    (time.perf_counter() - started, response.status_code))
+            return results
+
+        async def main():
+            return await asyncio.gather(*map(run, workers))
+
+        return [result for results in asyncio.run(main())
+                for result in results]
@@ -0,0 +1,56 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.filters import IngredientFilter
+from api.indexes import IngredientIndex
+from api.views import IngredientViewSet
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск ингредиентов через SearchFilter '
+            'и через индекс в памяти.')
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=100,
+                            help="number of runs per prefix")
+        parser.add_argument("--prefix-length", type=int, default=2,
+                            help="length of the sampled prefixes")
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        names = Ingredient.objects.values_list('name', flat=True)
+        prefixes = sorted({
+            name[:options["prefix_length"]] for name in names
+        })[:50]
+        if not prefixes:
+            self.stderr.write('Справочник ингредиентов пуст.')
+            return
+
+        factory = APIRequestFactory()
+        requests = [
+            Request(factory.get('/api/ingredients/', {'name': prefix}))
+            for prefix in prefixes
+        ]
+        backend = IngredientFilter()
+        view = IngredientViewSet()
+        index = IngredientIndex.build()
+
+        def search_filter():
+            for request in requests:
+                list(SearchFilter.filter_queryset(
+                    backend, request, Ingredient.objects.all(), view))
+
+        def ingredient_index():
+            for request in requests:
+                index.search(backend.get_search_terms(request))
+
+        for title, func in (('SearchFilter', search_filter),
+                            ('IngredientIndex', ingredient_index)):
+            seconds = min(timeit.repeat(func, number=repeat, repeat=3))
+            per_query = seconds / (repeat * len(requests)) * 1e6
+            self.stdout.write(f'{title}: {per_query:.1f} мкс на запрос')
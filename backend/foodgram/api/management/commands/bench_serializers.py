@@ -0,0 +1,70 @@
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import RecipeViewSet, ShowSubscriptionsView
+from users.models import FoodgramUser, Subscription
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает вывод списка рецептов и подписок через '
+            'сериализаторы DRF и через api.representations '
+            '(FAST_SERIALIZATION). Ответы обоих способов должны совпадать.')
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20,
+                            help="number of requests per endpoint")
+        parser.add_argument("--limit", type=int, default=100,
+                            help="page size")
+        parser.add_argument("--email", type=str, default=None,
+                            help="user making the requests; by default "
+                                 "the one with the most subscriptions")
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["email"])
+        factory = APIRequestFactory()
+        limit = options["limit"]
+        endpoints = (
+            ('рецепты', RecipeViewSet.as_view({'get': 'list'}),
+             '/api/recipes/', {'limit': limit, 'cursor': ''}),
+            ('подписки', ShowSubscriptionsView.as_view(),
+             '/api/users/subscriptions/',
+             {'limit': limit, 'cursor': '', 'recipes_limit': 3}),
+        )
+        for title, view, path, params in endpoints:
+            def call():
+                request = factory.get(path, params)
+                force_authenticate(request, user)
+                response = view(request)
+                response.render()
+                return response
+
+            results = {}
+            for fast in (False, True):
+                with override_settings(FAST_SERIALIZATION=fast):
+                    response = call()
+                    seconds = min(timeit.repeat(
+                        call, number=options["repeat"], repeat=3))
+                results[fast] = response.content
+                objects = len(response.data['results']) * options["repeat"]
+                name = 'representations' if fast else 'DRF'
+                self.stdout.write(
+                    f'{title}, {name}: '
+                    f'{seconds / options["repeat"] * 1000:.1f} мс на запрос, '
+                    f'{objects / seconds:.0f} объектов/с')
+            if results[False] != results[True]:
+                raise CommandError(f'{title}: ответы различаются.')
+
+    def get_user(self, email):
+        if email is not None:
+            user = FoodgramUser.objects.filter(email=email).first()
+        else:
+            top = Subscription.objects.values('user').annotate(
+                subscriptions=Count('id')).order_by('-subscriptions').first()
+            user = top and FoodgramUser.objects.get(pk=top['user'])
+        if user is None:
+            raise CommandError('Пользователь не найден.')
+        return user
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from foodgram.metrics import serializer_timer
+from recipes.catalog import catalog_cache_timeout, get_catalog_version
+from recipes.membership import get_membership, get_membership_version
+from recipes.models import Recipe
+from recipes.versions import (RECIPE_LIST_VERSION_KEY, author_version_key,
+                              get_versions, recipe_version_key)
+
+from .representations import RECIPE_FIELDS, recipes, row_fields
+
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+ANONYMOUS_CACHE_TIMEOUT = 60 * 5
+ANONYMOUS_CACHE_STALE_TIMEOUT = 60 * 60
+ANONYMOUS_CACHE_LOCK_TIMEOUT = 30
+
+
+def recipe_list_version_keys(request):
+    """
+    Ключи версий, от которых зависит список рецептов: список одного
+    автора, если фильтр только по нему, иначе общий список.
+    """
+    author = request.query_params.getlist('author')
+    if len(author) == 1 and author[0].isdigit():
+        return [author_version_key(author[0])]
+    return [RECIPE_LIST_VERSION_KEY]
+
+
+def catalog_cache_key(path, params, format, version):
+    url = f'{path}?{params}:{format}'
+    return f'catalog:{version}:{hashlib.md5(url.encode()).hexdigest()}'
+
+
+def catalog_etag(key, data):
+    content = json.dumps([key, data], ensure_ascii=False, sort_keys=True)
+    return f'"{hashlib.md5(content.encode()).hexdigest()}"'
+
+
+class CatalogCacheMixin:
+    """
+    Кэширование ответов справочников.
+    Сериализованные данные хранятся под ключом текущей версии справочников,
+    ответы снабжаются ETag, а совпадающий If-None-Match получает 304
+    без обращения к базе данных и сериализаторам.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_catalog_cache_key(self, request):
+        return catalog_cache_key(
+            request.path, sorted(request.query_params.lists()),
+            request.accepted_renderer.format, get_catalog_version())
+
+    def get_cached_response(self, action, request, *args, **kwargs):
+        key = self.get_catalog_cache_key(request)
+        cached = cache.get(key)
+        if cached is None:
+            response = action(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cached = (catalog_etag(key, response.data), response.data)
+            cache.set(key, cached,
+                      catalog_cache_timeout(CATALOG_CACHE_TIMEOUT))
+        etag, data = cached
+        response = Response(data, headers={'ETag': etag})
+        return get_conditional_response(
+            request, etag=etag, response=response) or response
+
+
+class AnonymousCacheMixin:
+    """
+    Кэширование списка и страницы рецепта для анонимных пользователей.
+    Ключ — путь и отсортированные параметры запроса, в значении хранятся
+    версии данных, от которых зависит ответ: справочников, общего списка,
+    списка автора или отдельного рецепта. Устаревший или изменившийся
+    ответ пересчитывает только один процесс, остальные до этого момента
+    отдают прежний.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return super().list(request, *args, **kwargs)
+        return self.get_anonymous_response(
+            recipe_list_version_keys(request), super().list, request,
+            *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return super().retrieve(request, *args, **kwargs)
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        key = recipe_version_key(kwargs[lookup])
+        return self.get_anonymous_response(
+            [key], super().retrieve, request, *args, **kwargs)
+
+    def get_anonymous_cache_key(self, request):
+        params = sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+        )
+        path = request.build_absolute_uri(request.path)
+        url = f'{path}?{params}:{request.accepted_renderer.format}'
+        return f'anonymous:{hashlib.md5(url.encode()).hexdigest()}'
+
+    def get_anonymous_response(self, keys, action, request, *args, **kwargs):
+        key = self.get_anonymous_cache_key(request)
+        versions = (get_catalog_version(), *get_versions(keys))
+        cached = cache.get(key)
+        if cached is not None:
+            cached_versions, expires, data = cached
+            if cached_versions == versions and expires > time.time():
+                return Response(data)
+            if not cache.add(f'{key}:lock', True,
+                             ANONYMOUS_CACHE_LOCK_TIMEOUT):
+                return Response(data)
+        try:
+            response = action(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(
+                    key,
+                    (versions, time.time() + ANONYMOUS_CACHE_TIMEOUT,
+                     response.data),
+                    ANONYMOUS_CACHE_STALE_TIMEOUT
+                )
+            elif cached is not None:
+                cache.delete(key)
+            return response
+        finally:
+            if cached is not None:
+                cache.delete(f'{key}:lock')
+
+
+class ConditionalGetMixin:
+    """
+    Условные запросы к рецептам.
+    С общим кэшем (SHARED_CACHE) ETag строится по версиям из
+    recipes.versions, тем же, что у кэша анонимных ответов, и версиям
+    справочников и отметок пользователя — проверка не обращается к базе
+    данных. Кэш процесса не видит изменений в других процессах и
+    командах, поэтому без него валидаторы берутся из базы данных:
+    у списка — наибольший updated_at и число отфильтрованных рецептов,
+    у рецепта — его updated_at, а отметки пользователя входят в ETag
+    отпечатком своих множеств. Совпадение If-None-Match даёт 304 до
+    выборки и сериализации данных. Last-Modified рецепта сообщается,
+    но не проверяется: в нём нет отметок пользователя.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if settings.SHARED_CACHE:
+            versions = get_versions(recipe_list_version_keys(request))
+        else:
+            versions = self.filter_queryset(
+                self.get_queryset()).order_by().aggregate(
+                modified=Max('updated_at'), count=Count('pk'))
+            versions = (versions['modified'], versions['count'])
+        etag = self.get_etag(request, request.get_full_path(), versions)
+        return self.get_conditional(
+            request, etag, None, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        # Как и get_object, нечисловой id даёт 404, а не ошибку сервера.
+        modified = get_object_or_404(
+            Recipe.objects.values_list('updated_at', flat=True),
+            pk=kwargs[lookup])
+        etag = self.get_etag(request, kwargs[lookup], modified)
+        return self.get_conditional(
+            request, etag, int(modified.timestamp()), super().retrieve,
+            *args, **kwargs)
+
+    def get_etag(self, request, *values):
+        if not settings.SHARED_CACHE:
+            validators = get_membership(request).fingerprint()
+        elif request.user.is_authenticated:
+            validators = (get_catalog_version(), request.user.pk,
+                          get_membership_version(request.user.pk))
+        else:
+            validators = (get_catalog_version(), None)
+        content = repr((validators, values))
+        return f'"{hashlib.md5(content.encode()).hexdigest()}"'
+
+    def get_conditional(self, request, etag, last_modified, action,
+                        *args, **kwargs):
+        headers = {'ETag': etag}
+        if last_modified is not None:
+            headers['Last-Modified'] = http_date(last_modified)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return Response(status=not_modified.status_code, headers=headers)
+        response = action(request, *args, **kwargs)
+        if response.status_code == 200:
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+
+class FastRecipeReadMixin:
+    """
+    Список и страница рецепта без сериализаторов DRF: строки values()
+    превращаются в ответ функциями api.representations. Выключается
+    настройкой FAST_SERIALIZATION. Стоит после миксинов кэширования,
+    чтобы кэшировался уже готовый ответ.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_SERIALIZATION:
+            return super().list(request, *args, **kwargs)
+        queryset = self.get_rows()
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset) if page is None else page
+        with serializer_timer():
+            data = recipes(rows, request)
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.FAST_SERIALIZATION:
+            return super().retrieve(request, *args, **kwargs)
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(
+            self.get_rows(), **{self.lookup_field: kwargs[lookup]})
+        self.check_object_permissions(request, row)
+        with serializer_timer():
+            return Response(recipes([row], request)[0])
+
+    def get_rows(self):
+        """ Отфильтрованный queryset в виде строк с полями ответа. """
+        queryset = self.filter_queryset(
+            self.get_queryset()).prefetch_related(None)
+        return queryset.values(*row_fields(queryset, RECIPE_FIELDS))
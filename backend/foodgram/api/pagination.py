@@ -1,6 +1,140 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
-    page_size = 6
\ No newline at end of file
+    page_size = 6
+    max_page_size = 100
+
+
+class KeysetPagination(CustomPagination):
+    """
+    Постраничный вывод с курсором.
+    Включается параметром cursor (пустое значение — первая страница),
+    иначе работает как CustomPagination. Следующая страница выбирается
+    условием по полям ordering, поэтому её стоимость не зависит от глубины.
+    Явно заданная сортировка queryset (например, по релевантности поиска)
+    заменяет ordering, в ней допустимы и аннотации.
+    Общее число записей отдаётся только по запросу: count=exact
+    или count=approximate (оценка планировщика PostgreSQL).
+    """
+
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('id', )
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*self.ordering)
+        self.count = self.get_count(queryset, request)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = queryset.filter(
+                self.get_seek_filter(self.decode_cursor(queryset, cursor))
+            )
+        page = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = [
+                self.get_position_value(page[-1], field.lstrip('-'))
+                for field in self.ordering
+            ]
+        return page
+
+    @staticmethod
+    def get_position_value(row, name):
+        """ Значение поля курсора у объекта или у строки values(). """
+        if isinstance(row, dict):
+            return row[name]
+        return getattr(row, name)
+
+    def get_ordering(self, queryset):
+        return tuple(queryset.query.order_by) or self.ordering
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'approximate':
+            if connections[queryset.db].vendor == 'postgresql':
+                plan = json.loads(queryset.explain(format='json'))
+                return plan[0]['Plan']['Plan Rows']
+            return queryset.count()
+        if mode == 'exact':
+            return queryset.count()
+        return None
+
+    def get_seek_filter(self, position):
+        """ Записи строго после position в порядке ordering. """
+        seek, equal = Q(), {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            seek |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return seek
+
+    def encode_cursor(self, position):
+        values = [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in position
+        ]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, queryset, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            fields = [
+                self.get_cursor_field(queryset, field.lstrip('-'))
+                for field in self.ordering
+            ]
+            if len(values) != len(fields):
+                raise ValueError
+            return [
+                field.to_python(value) for field, value in zip(fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_cursor_field(self, queryset, name):
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        response = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+
+class RecipePagination(KeysetPagination):
+    ordering = ('-pub_date', '-id')
@@ -0,0 +1,377 @@
+import hashlib
+import os
+import re
+import struct
+import zlib
+from functools import lru_cache
+
+# Таблицы шрифта TrueType, нужные PDF для CIDFontType2 (ISO 32000-1, 9.9).
+EMBEDDED_TABLES = ('cvt ', 'fpgm', 'glyf', 'head', 'hhea', 'hmtx', 'loca',
+                   'maxp', 'prep')
+# Флаги составного глифа: аргументы-слова, масштаб, масштаб по осям,
+# матрица 2x2, за компонентом следует ещё один.
+ARG_WORDS, SCALE, XY_SCALE, TWO_BY_TWO, MORE_COMPONENTS = (
+    0x1, 0x8, 0x40, 0x80, 0x20)
+
+
+def checksum(data):
+    data += b'\0' * (-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+def write_font(tables):
+    """ Файл TrueType из таблиц {тег: байты} с поправкой контрольной суммы. """
+    tags = sorted(tables)
+    power = 1 << (len(tags).bit_length() - 1)
+    header = struct.pack('>IHHHH', 0x00010000, len(tags), power * 16,
+                         power.bit_length() - 1, (len(tags) - power) * 16)
+    offset = len(header) + 16 * len(tags)
+    directory, body, offsets = [], [], {}
+    for tag in tags:
+        table = tables[tag]
+        directory.append(struct.pack('>4sIII', tag.encode('latin-1'),
+                                     checksum(table), offset, len(table)))
+        offsets[tag] = offset
+        body.append(table + b'\0' * (-len(table) % 4))
+        offset += len(body[-1])
+    font = bytearray(header + b''.join(directory) + b''.join(body))
+    struct.pack_into('>I', font, offsets['head'] + 8,
+                     (0xB1B0AFBA - checksum(bytes(font))) & 0xFFFFFFFF)
+    return bytes(font)
+
+
+class TrueTypeFont:
+    """ Метрики и таблица символов шрифта TrueType для встраивания в PDF. """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+        tables = self._read_tables(data)
+        head, hhea = tables['head'][0], tables['hhea'][0]
+        self.units_per_em, = struct.unpack_from('>H', data, head + 18)
+        self.bbox = struct.unpack_from('>4h', data, head + 36)
+        self.ascent, self.descent = struct.unpack_from('>2h', data, hhea + 4)
+        self.metrics_count, = struct.unpack_from('>H', data, hhea + 34)
+        self.advances = struct.unpack_from(
+            f'>{self.metrics_count}I', data, tables['hmtx'][0])
+        self.glyphs = self._read_cmap(data, tables['cmap'][0])
+        self.name = re.sub(
+            r'[^A-Za-z0-9-]', '', os.path.splitext(os.path.basename(path))[0]
+        ) or 'Font'
+        self.tables = {
+            tag: data[offset:offset + length]
+            for tag, (offset, length) in tables.items()
+            if tag in EMBEDDED_TABLES
+        }
+        self.loca = self._read_loca(data, tables)
+
+    @staticmethod
+    def _read_tables(data):
+        """ Смещение и длина каждой таблицы по её тегу. """
+        count = struct.unpack_from('>H', data, 4)[0]
+        tables = {}
+        for i in range(count):
+            tag, _, offset, length = struct.unpack_from(
+                '>4sIII', data, 12 + 16 * i)
+            tables[tag.decode('latin-1')] = offset, length
+        return tables
+
+    @staticmethod
+    def _read_loca(data, tables):
+        """ Смещения глифов в glyf; последнее — конец последнего глифа. """
+        long_offsets, = struct.unpack_from('>h', data, tables['head'][0] + 50)
+        count, = struct.unpack_from('>H', data, tables['maxp'][0] + 4)
+        if long_offsets:
+            return struct.unpack_from(f'>{count + 1}I', data,
+                                      tables['loca'][0])
+        return tuple(offset * 2 for offset in struct.unpack_from(
+            f'>{count + 1}H', data, tables['loca'][0]))
+
+    @staticmethod
+    def _read_cmap(data, cmap):
+        """ Соответствие символов BMP номерам глифов (cmap формата 4). """
+        count = struct.unpack_from('>H', data, cmap + 2)[0]
+        for i in range(count):
+            platform, encoding, offset = struct.unpack_from(
+                '>HHI', data, cmap + 4 + 8 * i)
+            table = cmap + offset
+            if ((platform, encoding) in ((3, 1), (0, 3))
+                    and struct.unpack_from('>H', data, table)[0] == 4):
+                break
+        else:
+            raise ValueError('Шрифт не содержит таблицу символов Unicode.')
+        segments = struct.unpack_from('>H', data, table + 6)[0] // 2
+        ends = table + 14
+        starts = ends + 2 * segments + 2
+        deltas = starts + 2 * segments
+        range_offsets = deltas + 2 * segments
+        glyphs = {}
+        for i in range(segments):
+            end, = struct.unpack_from('>H', data, ends + 2 * i)
+            start, = struct.unpack_from('>H', data, starts + 2 * i)
+            delta, = struct.unpack_from('>H', data, deltas + 2 * i)
+            range_offset, = struct.unpack_from(
+                '>H', data, range_offsets + 2 * i)
+            for code in range(start, min(end, 0xFFFE) + 1):
+                if range_offset:
+                    position = (range_offsets + 2 * i + range_offset
+                                + 2 * (code - start))
+                    glyph, = struct.unpack_from('>H', data, position)
+                    if glyph:
+                        glyph = (glyph + delta) & 0xFFFF
+                else:
+                    glyph = (code + delta) & 0xFFFF
+                if glyph:
+                    glyphs[code] = glyph
+        return glyphs
+
+    def glyph(self, char):
+        return self.glyphs.get(ord(char), 0)
+
+    def width(self, glyph):
+        """ Ширина глифа в тысячных долях кегля. """
+        advance = self.advances[min(glyph, len(self.advances) - 1)] >> 16
+        return advance * 1000 // self.units_per_em
+
+    def scale(self, value):
+        return value * 1000 // self.units_per_em
+
+    def outline(self, glyph):
+        return self.tables['glyf'][self.loca[glyph]:self.loca[glyph + 1]]
+
+    def components(self, glyph):
+        """ Глифы, из которых собран составной глиф. """
+        outline = self.outline(glyph)
+        if len(outline) < 10 or struct.unpack_from('>h', outline)[0] >= 0:
+            return
+        position, flags = 10, MORE_COMPONENTS
+        while flags & MORE_COMPONENTS:
+            flags, component = struct.unpack_from('>HH', outline, position)
+            yield component
+            position += 8 if flags & ARG_WORDS else 6
+            if flags & SCALE:
+                position += 2
+            elif flags & XY_SCALE:
+                position += 4
+            elif flags & TWO_BY_TWO:
+                position += 8
+
+    def subset(self, glyphs):
+        """
+        Программа шрифта только с глифами glyphs, их составляющими
+        и .notdef. Номера глифов сохраняются (CIDToGIDMap /Identity),
+        остальные глифы пусты, их метрики обнулены.
+        """
+        keep, pending = set(), [0, *glyphs]
+        while pending:
+            glyph = pending.pop()
+            if glyph not in keep and glyph < len(self.loca) - 1:
+                keep.add(glyph)
+                pending.extend(self.components(glyph))
+        outlines, loca = [], [0]
+        for glyph in range(len(self.loca) - 1):
+            outline = self.outline(glyph) if glyph in keep else b''
+            outlines.append(outline + b'\0' * (-len(outline) % 4))
+            loca.append(loca[-1] + len(outlines[-1]))
+        head = bytearray(self.tables['head'])
+        struct.pack_into('>I', head, 8, 0)
+        struct.pack_into('>h', head, 50, 1)
+        return write_font({
+            **self.tables,
+            'head': bytes(head),
+            'glyf': b''.join(outlines),
+            'loca': struct.pack(f'>{len(loca)}I', *loca),
+            # Ширина глифов после metrics_count берётся из последней пары.
+            'hmtx': self._subset_hmtx(keep | {self.metrics_count - 1}),
+        })
+
+    def _subset_hmtx(self, keep):
+        """ hmtx с нулями вместо метрик глифов не из keep. """
+        source = self.tables['hmtx']
+        hmtx = bytearray(len(source))
+        for glyph in keep:
+            if glyph < self.metrics_count:
+                start, end = 4 * glyph, 4 * glyph + 4
+            else:
+                start = 4 * self.metrics_count + 2 * (
+                    glyph - self.metrics_count)
+                end = start + 2
+            hmtx[start:end] = source[start:end]
+        return bytes(hmtx)
+
+
+@lru_cache
+def load_font(path):
+    return TrueTypeFont(path)
+
+
+class PDFDocument:
+    """
+    Потоковая запись текстового PDF.
+    Страницы отдаются по мере заполнения, между ними в памяти
+    остаются только смещения объектов и набор использованных глифов;
+    в конце встраивается подмножество шрифта с этими глифами.
+    """
+
+    page_width = 595
+    page_height = 842
+    margin = 56
+    font_size = 12
+    leading = 16
+
+    CATALOG, PAGES, FONT, CID_FONT, DESCRIPTOR, FONT_FILE, TO_UNICODE = range(
+        1, 8)
+
+    def __init__(self, font):
+        self.font = font
+        self.offsets = {}
+        self.position = 0
+        self.used = {}
+
+    def render(self, lines):
+        """ Генератор байтов документа из последовательности строк. """
+        yield self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        pages = []
+        number = self.TO_UNICODE + 1
+        for page in self._paginate(lines):
+            content = zlib.compress(self._page_content(page))
+            yield self._stream(number, content, b'/Filter /FlateDecode')
+            yield self._object(number + 1, b'<< /Type /Page /Parent %d 0 R '
+                               b'/MediaBox [0 0 %d %d] '
+                               b'/Resources << /Font << /F1 %d 0 R >> >> '
+                               b'/Contents %d 0 R >>' % (
+                                   self.PAGES, self.page_width,
+                                   self.page_height, self.FONT, number))
+            pages.append(number + 1)
+            number += 2
+        yield from self._font_objects()
+        kids = b' '.join(b'%d 0 R' % page for page in pages)
+        yield self._object(self.PAGES, b'<< /Type /Pages /Kids [%s] '
+                           b'/Count %d >>' % (kids, len(pages)))
+        yield self._object(self.CATALOG, b'<< /Type /Catalog '
+                           b'/Pages %d 0 R >>' % self.PAGES)
+        yield self._xref(number)
+
+    def _write(self, chunk):
+        self.position += len(chunk)
+        return chunk
+
+    def _object(self, number, body):
+        self.offsets[number] = self.position
+        return self._write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def _stream(self, number, data, dictionary=b''):
+        return self._object(number, b'<< /Length %d %s >>\nstream\n%s'
+                            b'\nendstream' % (len(data), dictionary, data))
+
+    def _wrap(self, line):
+        """ Разбивает строку по словам на части не шире поля страницы. """
+        limit = (self.page_width - 2 * self.margin) * 1000 // self.font_size
+        space = self.font.width(self.font.glyph(' '))
+        current, width = [], 0
+        for word in line.split(' '):
+            word_width = sum(self.font.width(self.font.glyph(char))
+                             for char in word)
+            if current and width + space + word_width > limit:
+                yield ' '.join(current)
+                current, width = [], 0
+            width += word_width + (space if current else 0)
+            current.append(word)
+        yield ' '.join(current)
+
+    def _paginate(self, lines):
+        per_page = (self.page_height - 2 * self.margin) // self.leading
+        page, empty = [], True
+        for line in lines:
+            for part in self._wrap(line):
+                page.append(part)
+                if len(page) == per_page:
+                    yield page
+                    page, empty = [], False
+        if page or empty:
+            yield page
+
+    def _encode(self, text):
+        glyphs = []
+        for char in text:
+            glyph = self.font.glyph(char)
+            self.used.setdefault(glyph, char)
+            glyphs.append(b'%04X' % glyph)
+        return b''.join(glyphs)
+
+    def _page_content(self, lines):
+        top = self.page_height - self.margin - self.font_size
+        content = [b'BT /F1 %d Tf %d TL %d %d Td' % (
+            self.font_size, self.leading, self.margin, top)]
+        for line in lines:
+            content.append(b'<%s> Tj T*' % self._encode(line))
+        content.append(b'ET')
+        return b'\n'.join(content)
+
+    def _font_objects(self):
+        font = self.font
+        # Подмножество шрифта помечается шестью заглавными буквами.
+        digest = hashlib.md5(repr(sorted(self.used)).encode()).digest()
+        name = bytes(65 + byte % 26 for byte in digest[:6]) + (
+            b'+' + font.name.encode())
+        widths = b' '.join(b'%d [%d]' % (glyph, font.width(glyph))
+                           for glyph in sorted(self.used))
+        yield self._object(self.FONT, b'<< /Type /Font /Subtype /Type0 '
+                           b'/BaseFont /%s /Encoding /Identity-H '
+                           b'/DescendantFonts [%d 0 R] /ToUnicode %d 0 R >>'
+                           % (name, self.CID_FONT, self.TO_UNICODE))
+        yield self._object(self.CID_FONT, b'<< /Type /Font '
+                           b'/Subtype /CIDFontType2 /BaseFont /%s '
+                           b'/CIDSystemInfo << /Registry (Adobe) '
+                           b'/Ordering (Identity) /Supplement 0 >> '
+                           b'/FontDescriptor %d 0 R /W [%s] '
+                           b'/CIDToGIDMap /Identity >>'
+                           % (name, self.DESCRIPTOR, widths))
+        bbox = b' '.join(b'%d' % font.scale(value) for value in font.bbox)
+        ascent, descent = font.scale(font.ascent), font.scale(font.descent)
+        yield self._object(self.DESCRIPTOR, b'<< /Type /FontDescriptor '
+                           b'/FontName /%s /Flags 32 /FontBBox [%s] '
+                           b'/ItalicAngle 0 /Ascent %d /Descent %d '
+                           b'/CapHeight %d /StemV 80 /FontFile2 %d 0 R >>'
+                           % (name, bbox, ascent, descent, ascent,
+                              self.FONT_FILE))
+        program = font.subset(self.used)
+        yield self._stream(self.FONT_FILE, zlib.compress(program),
+                           b'/Length1 %d /Filter /FlateDecode' % len(program))
+        yield self._stream(self.TO_UNICODE, self._to_unicode())
+
+    def _to_unicode(self):
+        mapping = [
+            b'<%04X> <%s>' % (glyph, char.encode('utf-16-be').hex().encode())
+            for glyph, char in sorted(self.used.items())
+        ]
+        chunks = [mapping[i:i + 100] for i in range(0, len(mapping), 100)]
+        return b'\n'.join([
+            b'/CIDInit /ProcSet findresource begin',
+            b'12 dict begin',
+            b'begincmap',
+            b'/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) '
+            b'/Supplement 0 >> def',
+            b'/CMapName /Adobe-Identity-UCS def',
+            b'/CMapType 2 def',
+            b'1 begincodespacerange',
+            b'<0000> <FFFF>',
+            b'endcodespacerange',
+            *(b'%d beginbfchar\n%s\nendbfchar'
+              % (len(chunk), b'\n'.join(chunk)) for chunk in chunks),
+            b'endcmap',
+            b'CMapName currentdict /CMap defineresource pop',
+            b'end',
+            b'end',
+        ])
+
+    def _xref(self, size):
+        start = self.position
+        entries = [b'0000000000 65535 f \n']
+        entries.extend(b'%010d 00000 n \n' % self.offsets[number]
+                       for number in range(1, size))
+        return self._write(b'xref\n0 %d\n%strailer\n'
+                           b'<< /Size %d /Root %d 0 R >>\n'
+                           b'startxref\n%d\n%%%%EOF\n'
+                           % (size, b''.join(entries), size, self.CATALOG,
+                              start))
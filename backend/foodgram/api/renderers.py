@@ -0,0 +1,124 @@
+import abc
+import csv
+import json
+import logging
+from itertools import chain
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import BaseRenderer
+
+from .pdf import PDFDocument, load_font
+
+SHOPPING_LIST_TITLE = 'Cписок покупок:'
+
+logger = logging.getLogger(__name__)
+
+
+class ShoppingListUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = ('Список покупок в PDF недоступен: не найден шрифт. '
+                      'Выберите format=txt или format=csv.')
+    default_code = 'shopping_list_unavailable'
+
+
+def shopping_list_lines(ingredients):
+    for item in ingredients:
+        yield (
+            f"{item['ingredient__name']} - "
+            f"{item['amount']} {item['ingredient__measurement_unit']}"
+        )
+
+
+class Echo:
+    """ Файлоподобный объект, возвращающий записанную строку. """
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(abc.ABC, BaseRenderer):
+    """
+    Базовый рендерер списка покупок.
+    Сам список отдаётся потоком через stream(),
+    render() используется только для ответов с ошибками
+    и отдаёт их в JSON.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    @abc.abstractmethod
+    def stream(self, ingredients):
+        """ Итератор частей файла по строкам суммированных ингредиентов. """
+
+    @property
+    def content_type(self):
+        if self.charset:
+            return f'{self.media_type}; charset={self.charset}'
+        return self.media_type
+
+
+class ShoppingListTXTRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        yield SHOPPING_LIST_TITLE
+        separator = ''
+        for line in shopping_list_lines(ingredients):
+            yield f'{separator}\n{line}'
+            separator = ', '
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ['Ингредиент', 'Количество', 'Единица измерения'])
+        for item in ingredients:
+            yield writer.writerow([
+                item['ingredient__name'],
+                item['amount'],
+                item['ingredient__measurement_unit']
+            ])
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def stream(self, ingredients):
+        try:
+            font = load_font(settings.SHOPPING_LIST_FONT)
+        except (OSError, ValueError):
+            logger.exception('Не удалось загрузить шрифт SHOPPING_LIST_FONT '
+                             '%s', settings.SHOPPING_LIST_FONT)
+            raise ShoppingListUnavailable
+        document = PDFDocument(font)
+        return document.render(chain(
+            [SHOPPING_LIST_TITLE], shopping_list_lines(ingredients)
+        ))
+
+
+class PrometheusRenderer(BaseRenderer):
+    """ Метрики в текстовом формате Prometheus, ошибки — в JSON. """
+
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, str):
+            data = json.dumps(data, ensure_ascii=False)
+        return data.encode('utf-8')
@@ -1,8 +1,12 @@
 from django.db import transaction, IntegrityError
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.deletion import Collector
 from djoser.serializers import UserCreateSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework.validators import UniqueTogetherValidator
 from rest_framework import serializers
+from foodgram.metrics import TimedSerializerMixin
 from users.models import (
     FoodgramUser,
     Subscription
@@ -13,13 +17,42 @@ from recipes.models import (
     Ingredient,
     Recipe,
     Favorite,
-    ShoppingCart,
-    RecipeTag
+    ShoppingCart
 )
+from recipes.images import IMAGE_VARIANTS
+from recipes.membership import get_membership
 
 import base64
 
-class FoodgramUserCreateSerializer(UserCreateSerializer):
+# Наибольшее число рецептов в одном пакетном запросе.
+RECIPE_BATCH_SIZE = 100
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Ссылки на уменьшенные копии изображения рецепта.
+    Пока копии не готовы, вместо них отдаётся оригинал.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        request = self.context.get('request')
+        variants = {}
+        for name in IMAGE_VARIANTS:
+            path = recipe.image_variants.get(name)
+            url = default_storage.url(path) if path else recipe.image.url
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            variants[name] = url
+        return variants
+
+
+class FoodgramUserCreateSerializer(TimedSerializerMixin, UserCreateSerializer):
     """ Сериализатор создания пользователя. """
 
     class Meta:
@@ -32,7 +65,8 @@ class FoodgramUserCreateSerializer(UserCreateSerializer):
             'password'
         ]
 
-class FoodgramUserSerializer(serializers.ModelSerializer):
+class FoodgramUserSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     """ Сериализатор модели пользователя. """
 
     is_subscribed = serializers.SerializerMethodField(read_only=True)
@@ -49,14 +83,12 @@ class FoodgramUserSerializer(serializers.ModelSerializer):
         ]
     
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Subscription.objects.filter(
-            user=request.user, author=obj
-        ).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        membership = get_membership(self.context.get('request'))
+        return obj.id in membership.subscriptions
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Сериализатор просмотра модели Тег. """
 
     class Meta:
@@ -64,7 +96,8 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'color', 'slug']
 
 
-class IngredientAmountSerializer(serializers.ModelSerializer):
+class IngredientAmountSerializer(TimedSerializerMixin,
+                                 serializers.ModelSerializer):
     """ Сериализатор модели, связывающей ингредиенты и рецепт. """
 
     id = serializers.ReadOnlyField(source='ingredient.id')
@@ -78,7 +111,7 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'amount', 'measurement_unit']
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Сериализатор просмотра модели Ингредиенты. """
 
     class Meta:
@@ -86,7 +119,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'measurement_unit']
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Сериализатор просмотра модели Рецепт. """
 
     tags = TagSerializer(many=True)
@@ -96,6 +129,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         method_name='get_is_favorited')
     is_in_shopping_cart = serializers.SerializerMethodField(
         method_name='get_is_in_shopping_cart')
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -108,29 +142,22 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time'
         ]
 
     def get_ingredients(self, obj):
-        ingredients = IngredientAmount.objects.filter(recipe=obj)
+        ingredients = obj.ingredientamount_set.all()
         return IngredientAmountSerializer(ingredients, many=True).data
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(
-            user=request.user, recipe_id=obj
-        ).exists()
+        membership = get_membership(self.context.get('request'))
+        return obj.id in membership.favorites
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(
-            user=request.user, recipe_id=obj
-        ).exists()
+        membership = get_membership(self.context.get('request'))
+        return obj.id in membership.shopping_cart
 
 
 class AddIngredientRecipeSerializer(serializers.ModelSerializer):
@@ -144,7 +171,8 @@ class AddIngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ['id', 'amount']
 
 
-class CreateRecipeSerializer(serializers.ModelSerializer):
+class CreateRecipeSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     """ Сериализатор создания/обновления рецепта. """
 
     author = FoodgramUserSerializer(read_only=True)
@@ -168,39 +196,76 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         ]
 
     def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
-        list = []
+        ingredients = data.get('ingredients') or []
+        ids = set()
         for i in ingredients:
-            amount = i['amount']
-            if int(amount) < 1:
+            if i['amount'] < 1:
                 raise serializers.ValidationError({
                    'amount': 'Количество ингредиента должно быть больше 0!'
                 })
-            if i['id'] in list:
+            if i['id'] in ids:
                 raise serializers.ValidationError({
                    'ingredient': 'Ингредиенты должны быть уникальными!'
                 })
-            list.append(i['id'])
+            ids.add(i['id'])
         if data['cooking_time'] < 0:
             raise serializers.ValidationError({
                 'cooking_time': 'Время приготовления должно быть неотрицательным!'
             })
-        if not data.get('ingredients'):
+        if not ingredients:
             raise serializers.ValidationError({
                 'ingredients': 'Должен быть указан хотя бы один ингредиент!'
             })
+        if len(Ingredient.objects.in_bulk(ids)) != len(ids):
+            raise serializers.ValidationError({
+                'ingredients': 'Указан несуществующий ингредиент!'
+            })
         return data
 
     def create_ingredients(self, ingredients, recipe):
-        for i in ingredients:
-            ingredient = Ingredient.objects.get(id=i['id'])
-            IngredientAmount.objects.create(
-                ingredient=ingredient, recipe=recipe, amount=i['amount']
-            )
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                ingredient_id=i['id'], recipe=recipe, amount=i['amount']
+            ) for i in ingredients
+        )
 
     def create_tags(self, tags, recipe):
-        for tag in tags:
-            RecipeTag.objects.create(recipe=recipe, tag=tag)
+        recipe.tags.add(*tags)
+
+    def update_ingredients(self, ingredients, recipe):
+        """ Применяет к рецепту разницу между старым и новым составом. """
+        amounts = {i['id']: i['amount'] for i in ingredients}
+        current = {
+            item.ingredient_id: item
+            for item in IngredientAmount.objects.filter(recipe=recipe)
+        }
+        removed = [
+            item for ingredient_id, item in current.items()
+            if ingredient_id not in amounts
+        ]
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != item.amount:
+                item.amount = amount
+                changed.append(item)
+        if removed:
+            # Удаление уже выбранных строк, как в QuerySet.delete(),
+            # но без повторного SELECT для сигналов post_delete.
+            queryset = IngredientAmount.objects.filter(
+                id__in=[item.id for item in removed])
+            collector = Collector(using=queryset.db, origin=queryset)
+            collector.collect(removed)
+            collector.delete()
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ['amount'])
+        self.create_ingredients(
+            [i for i in ingredients if i['id'] not in current], recipe
+        )
+
+    def update_tags(self, tags, recipe):
+        """ Применяет к рецепту разницу между старым и новым набором тегов. """
+        recipe.tags.set(tags)
 
     def create(self, validated_data):
         """
@@ -219,18 +284,19 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         except IntegrityError:
             raise Exception('Ошибка создания рецепта')
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """
         Изменение рецепта.
-        Доступно только автору.
+        Доступно только автору. Сохранение рецепта в конце обновляет
+        его updated_at один раз за изменение, а не на каждую строку
+        удалённых ингредиентов.
         """
 
-        RecipeTag.objects.filter(recipe=instance).delete()
-        IngredientAmount.objects.filter(recipe=instance).delete()
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        self.create_ingredients(ingredients, instance)
-        self.create_tags(tags, instance)
+        self.update_ingredients(ingredients, instance)
+        self.update_tags(tags, instance)
         instance.name = validated_data.pop('name')
         instance.text = validated_data.pop('text')
         if validated_data.get('image'):
@@ -240,20 +306,42 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'ingredientamount_set',
+                queryset=IngredientAmount.objects.select_related('ingredient')
+            )
+        )
         return RecipeSerializer(instance, context={
             'request': self.context.get('request')
         }).data
 
 
-class ShowFavoriteSerializer(serializers.ModelSerializer):
+class ShowFavoriteSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     """ Сериализатор для отображения избранного. """
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
+        fields = ['id', 'name', 'image', 'image_variants', 'cooking_time']
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
+class RecipeBatchSerializer(serializers.Serializer):
+    """ Список id рецептов для пакетного добавления или удаления. """
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=RECIPE_BATCH_SIZE
+    )
+
+
+class ShoppingCartSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     """ Сериализатор для списка покупок. """
 
     class Meta:
@@ -266,7 +354,7 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         }).data
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Сериализатор модели Избранное. """
 
     class Meta:
@@ -279,12 +367,13 @@ class FavoriteSerializer(serializers.ModelSerializer):
         }).data
 
 
-class ShowSubscriptionsSerializer(serializers.ModelSerializer):
+class ShowSubscriptionsSerializer(TimedSerializerMixin,
+                                  serializers.ModelSerializer):
     """ Сериализатор для отображения подписок пользователя. """
 
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = FoodgramUser
@@ -300,28 +389,28 @@ class ShowSubscriptionsSerializer(serializers.ModelSerializer):
         ]
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Subscription.objects.filter(
-            user=request.user, author=obj).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        membership = get_membership(self.context.get('request'))
+        return obj.id in membership.subscriptions
 
     def get_recipes(self, obj):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        recipes = Recipe.objects.filter(author=obj)
-        limit = request.query_params.get('recipes_limit')
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'recipes_preview'):
+            recipes = obj.recipes_preview
+        else:
+            recipes = Recipe.objects.filter(author=obj)
+            limit = request.query_params.get('recipes_limit')
+            if limit:
+                recipes = recipes[:int(limit)]
         return ShowFavoriteSerializer(
             recipes, many=True, context={'request': request}).data
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
-
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     """ Сериализатор подписок. """
 
     class Meta:
@@ -335,6 +424,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         ]
 
     def to_representation(self, instance):
+        instance.author.is_subscribed = True
         return ShowSubscriptionsSerializer(instance.author, context={
             'request': self.context.get('request')
         }).data
\ No newline at end of file
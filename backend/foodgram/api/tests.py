@@ -0,0 +1,1224 @@
+"""
+Бюджеты запросов к базе данных для конечных адресов API.
+
+Каждый адрес вызывается на синтетических данных нескольких масштабов
+с холодным кэшем. Число SQL-запросов (без управления транзакциями)
+не должно превышать заявленного бюджета и не должно расти с объёмом
+данных, а повтор одного запроса больше NPLUSONE_THRESHOLD раз считается
+ошибкой (foodgram.nplusone). Время ответа и размер тела записываются
+в отчёт API_BENCHMARK_REPORT (JSON Lines), если задан путь к нему.
+
+    python manage.py test api
+    API_BENCHMARK_REPORT=bench.jsonl python manage.py test api
+"""
+import base64
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zlib
+from collections import namedtuple
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from asgiref.sync import sync_to_async
+from django.test import (AsyncRequestFactory, RequestFactory,
+                         SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image, ImageDraw, ImageFont
+from rest_framework import serializers, viewsets
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
+
+from foodgram.metrics import (Registry, RequestMetrics,
+                              RequestMetricsMiddleware, registry)
+from foodgram.nplusone import fingerprint, track_queries
+from foodgram.replicas import (STICKY_COOKIE, ReplicaMiddleware,
+                               _read_replica)
+
+from recipes import images
+from recipes.catalog import get_catalog_version
+from recipes.images import IMAGE_VARIANTS
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Tag)
+from users.authentication import token_cache
+from users.models import FoodgramUser, Subscription
+
+from . import async_views
+from .indexes import get_ingredient_index
+from .mixins import AnonymousCacheMixin, FastRecipeReadMixin
+from .pdf import PDFDocument, TrueTypeFont, checksum, load_font, write_font
+from .views import FavoriteView, ShoppingCartView, TagViewSet, metrics
+
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwAD'
+    'hgGAWjR9awAAAABJRU5ErkJggg=='
+)
+MEDIA_ROOT = tempfile.mkdtemp(prefix='foodgram-tests-')
+# Кэши двух процессов: у каждого LocMemCache своё хранилище.
+WORKER_CACHES = {
+    worker: {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': worker,
+    }}
+    for worker in ('worker-a', 'worker-b')
+}
+TRANSACTION_SQL = re.compile(
+    r'^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE SAVEPOINT)\b', re.I)
+
+# prepare — имя запроса из ENDPOINTS, который выполняется перед
+# замером и готовит данные (например, добавление перед удалением).
+Endpoint = namedtuple(
+    'Endpoint', 'name method path client data status budget prepare',
+    defaults=(None, ))
+
+# Списки рецептов без общего кэша (как в тестах) тратят один запрос
+# на валидатор ETag из базы данных, см. ConditionalGetMixin. Пакетное
+# удаление, как QuerySet.delete(), выбирает строки перед DELETE.
+ENDPOINTS = (
+    Endpoint('recipe list', 'get', '/api/recipes/', 'anon', None, 200, 5),
+    Endpoint('recipe list', 'get', '/api/recipes/', 'auth', None, 200, 7),
+    Endpoint('recipe list limit', 'get', '/api/recipes/?limit=50', 'auth',
+             None, 200, 7),
+    Endpoint('recipes by tags', 'get',
+             '/api/recipes/?tags=lunch&tags=dinner', 'auth', None, 200, 8),
+    Endpoint('recipes by author', 'get', '/api/recipes/?author={author}',
+             'anon', None, 200, 5),
+    Endpoint('favorited recipes', 'get', '/api/recipes/?is_favorited=1',
+             'auth', None, 200, 7),
+    Endpoint('recipes in cart', 'get',
+             '/api/recipes/?is_in_shopping_cart=1', 'auth', None, 200, 7),
+    Endpoint('recipe search', 'get', '/api/recipes/?search=суп', 'auth',
+             None, 200, 6),
+    Endpoint('recipe detail', 'get', '/api/recipes/{recipe}/', 'anon',
+             None, 200, 4),
+    Endpoint('recipe detail', 'get', '/api/recipes/{recipe}/', 'auth',
+             None, 200, 6),
+    Endpoint('recipe detail invalid id', 'get', '/api/recipes/abc/',
+             'auth', None, 404, 1),
+    Endpoint('recipe detail missing', 'get', '/api/recipes/0/', 'auth',
+             None, 404, 2),
+    Endpoint('recipe create', 'post', '/api/recipes/', 'auth', 'recipe',
+             201, 20),
+    Endpoint('recipe update', 'patch', '/api/recipes/{own}/', 'auth',
+             'recipe', 200, 18),
+    Endpoint('recipe delete', 'delete', '/api/recipes/{own}/', 'auth',
+             None, 204, 20),
+    Endpoint('favorite', 'post', '/api/recipes/{recipe}/favorite/', 'auth',
+             None, 201, 4),
+    Endpoint('unfavorite', 'delete', '/api/recipes/{recipe}/favorite/',
+             'auth', None, 204, 4, 'favorite'),
+    Endpoint('add to cart', 'post', '/api/recipes/{recipe}/shopping_cart/',
+             'auth', None, 201, 3),
+    Endpoint('remove from cart', 'delete',
+             '/api/recipes/{recipe}/shopping_cart/', 'auth', None, 204, 3,
+             'add to cart'),
+    Endpoint('cart batch add', 'post', '/api/recipes/shopping_cart/', 'auth',
+             'batch', 200, 4),
+    Endpoint('cart batch remove', 'delete', '/api/recipes/shopping_cart/',
+             'auth', 'batch', 200, 5, 'cart batch add'),
+    Endpoint('favorite batch add', 'post', '/api/recipes/favorite/', 'auth',
+             'batch', 200, 5),
+    Endpoint('favorite batch remove', 'delete', '/api/recipes/favorite/',
+             'auth', 'batch', 200, 6, 'favorite batch add'),
+    Endpoint('subscriptions', 'get', '/api/users/subscriptions/', 'auth',
+             None, 200, 4),
+    Endpoint('subscriptions preview', 'get',
+             '/api/users/subscriptions/?recipes_limit=2', 'auth', None,
+             200, 4),
+    Endpoint('subscribe', 'post', '/api/users/{author}/subscribe/', 'auth',
+             None, 201, 5),
+    Endpoint('unsubscribe', 'delete', '/api/users/{author}/subscribe/',
+             'auth', None, 204, 4, 'subscribe'),
+    Endpoint('shopping list txt', 'get',
+             '/api/recipes/download_shopping_cart/?format=txt', 'auth',
+             None, 200, 2),
+    Endpoint('shopping list csv', 'get',
+             '/api/recipes/download_shopping_cart/?format=csv', 'auth',
+             None, 200, 2),
+    Endpoint('shopping list pdf', 'get',
+             '/api/recipes/download_shopping_cart/?format=pdf', 'auth',
+             None, 200, 2),
+    Endpoint('ingredients', 'get', '/api/ingredients/', 'anon', None,
+             200, 1),
+    Endpoint('ingredient search', 'get', '/api/ingredients/?name=со',
+             'anon', None, 200, 1),
+    Endpoint('ingredient detail', 'get', '/api/ingredients/{ingredient}/',
+             'anon', None, 200, 1),
+    Endpoint('tags', 'get', '/api/tags/', 'anon', None, 200, 1),
+    Endpoint('tag detail', 'get', '/api/tags/{tag}/', 'anon', None, 200, 1),
+    Endpoint('users', 'get', '/api/users/', 'auth', None, 200, 4),
+    Endpoint('user detail', 'get', '/api/users/{author}/', 'auth', None,
+             200, 3),
+    Endpoint('current user', 'get', '/api/users/me/', 'auth', None, 200, 2),
+    Endpoint('login', 'post', '/api/auth/token/login/', 'anon', 'login',
+             200, 4),
+    Endpoint('logout', 'post', '/api/auth/token/logout/', 'auth', None,
+             204, 4),
+)
+
+
+def create_dataset(scale):
+    """
+    Синтетические данные масштаба scale: по 5 * scale авторов
+    с четырьмя рецептами, 50 * scale ингредиентов, избранное,
+    корзина и подписки основного пользователя растут вместе с ними.
+    """
+    tags = [
+        Tag.objects.create(name=name, color=color, slug=slug)
+        for name, color, slug in (
+            ('Завтрак', '#E26C2D', 'breakfast'),
+            ('Обед', '#49B64E', 'lunch'),
+            ('Ужин', '#8775D2', 'dinner'),
+        )
+    ]
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(name=f'{prefix} {number}', measurement_unit='г')
+        for number in range(25 * scale)
+        for prefix in ('соль', 'мука')
+    )
+    user = FoodgramUser.objects.create_user(
+        email='user@example.com', username='user', first_name='Имя',
+        last_name='Фамилия', password='Pass-12345'
+    )
+    authors = [
+        FoodgramUser.objects.create_user(
+            email=f'author{number}@example.com', username=f'author{number}',
+            first_name='Автор', last_name=str(number), password='Pass-12345'
+        )
+        for number in range(5 * scale)
+    ]
+    recipes = []
+    for author in [user, *authors]:
+        for number in range(4):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Суп {author.username} {number}',
+                text='Описание рецепта', cooking_time=10 + number,
+                image='recipes/placeholder.png'
+            )
+            recipe.tags.add(tags[number % 3], tags[(number + 1) % 3])
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe=recipe, amount=amount + 1,
+                    ingredient=ingredients[
+                        (len(recipes) * 7 + amount) % len(ingredients)]
+                )
+                for amount in range(6)
+            )
+            recipes.append(recipe)
+    others = recipes[4:]
+    Favorite.objects.bulk_create(
+        Favorite(user=user, recipe=recipe) for recipe in others[::3])
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=user, recipe=recipe) for recipe in others[1::3])
+    for author in authors[::2]:
+        Subscription.objects.create(user=user, author=author)
+    return {
+        'user': user,
+        'tags': tags,
+        'ingredients': ingredients,
+        'ids': {
+            'author': authors[1].id,
+            'recipe': others[2].id,
+            'own': recipes[0].id,
+            'ingredient': ingredients[0].id,
+            'tag': tags[0].id,
+        },
+        'batch': [recipe.id for recipe in others[2:14]],
+    }
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WORKERS=0,
+                   NPLUSONE_DETECTION='raise')
+class EndpointBudgetTest(TestCase):
+    """ Бюджеты запросов на данных масштаба SCALE. """
+
+    SCALE = 1
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.report = []
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = create_dataset(cls.SCALE)
+        cls.token = Token.objects.create(user=cls.dataset['user'])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        path = os.getenv('API_BENCHMARK_REPORT')
+        if path and cls.report:
+            with open(path, 'a', encoding='utf-8') as file:
+                for row in cls.report:
+                    file.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def setUp(self):
+        self.clients = {'anon': APIClient(), 'auth': APIClient()}
+        self.clients['auth'].credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_data(self, kind):
+        dataset = self.dataset
+        if kind == 'recipe':
+            image = base64.b64encode(PNG).decode()
+            return {
+                'name': 'Суп дня',
+                'text': 'Описание',
+                'cooking_time': 15,
+                'image': f'data:image/png;base64,{image}',
+                'tags': [tag.id for tag in dataset['tags'][:2]],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': number + 1}
+                    for number, ingredient in enumerate(
+                        dataset['ingredients'][2:10])
+                ],
+            }
+        if kind == 'batch':
+            return {'recipes': dataset['batch']}
+        if kind == 'login':
+            return {'email': 'user@example.com', 'password': 'Pass-12345'}
+        return None
+
+    def request(self, endpoint):
+        client = self.clients[endpoint.client]
+        path = endpoint.path.format(**self.dataset['ids'])
+        return getattr(client, endpoint.method)(
+            path, self.get_data(endpoint.data), format='json')
+
+    def prepare(self, name):
+        endpoint = next(item for item in ENDPOINTS if item.name == name)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.request(endpoint)
+        self.assertEqual(response.status_code, endpoint.status)
+
+    def call(self, endpoint):
+        """ Запрос с холодным кэшем; возвращает ответ, SQL и время. """
+        cache.clear()
+        token_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = self.request(endpoint)
+                content = (b''.join(response.streaming_content)
+                           if response.streaming else response.content)
+                elapsed = time.perf_counter() - started
+        statements = [
+            query['sql'] for query in queries.captured_queries
+            if not TRANSACTION_SQL.match(query['sql'])
+        ]
+        return response, content, statements, elapsed
+
+    def test_query_budgets(self):
+        """
+        Каждый адрес замеряется в своей точке сохранения, которая затем
+        откатывается: замеры не зависят друг от друга и от порядка.
+        """
+        for endpoint in ENDPOINTS:
+            if (endpoint.name == 'shopping list pdf'
+                    and not os.path.exists(settings.SHOPPING_LIST_FONT)):
+                continue
+            label = f'{endpoint.method.upper()} {endpoint.path} ' \
+                    f'({endpoint.client})'
+            with self.subTest(endpoint=label, scale=self.SCALE), \
+                    transaction.atomic():
+                if endpoint.prepare:
+                    self.prepare(endpoint.prepare)
+                response, content, statements, elapsed = self.call(endpoint)
+                transaction.set_rollback(True)
+                self.report.append({
+                    'endpoint': endpoint.name,
+                    'request': label,
+                    'scale': self.SCALE,
+                    'status': response.status_code,
+                    'queries': len(statements),
+                    'budget': endpoint.budget,
+                    'ms': round(elapsed * 1000, 2),
+                    'bytes': len(content),
+                })
+                self.assertEqual(
+                    response.status_code, endpoint.status,
+                    content[:300].decode(errors='replace'))
+                self.assertLessEqual(
+                    len(statements), endpoint.budget,
+                    f'{label}: {len(statements)} запросов при бюджете '
+                    f'{endpoint.budget}:\n' + '\n'.join(statements))
+
+
+class LargeEndpointBudgetTest(EndpointBudgetTest):
+    """ Те же бюджеты на данных в четыре раза больше. """
+
+    SCALE = 4
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WORKERS=0)
+class ConditionalGetTest(TestCase):
+    """ Условные запросы к рецептам (ConditionalGetMixin). """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = create_dataset(1)
+        cls.token = Token.objects.create(user=cls.dataset['user'])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    @override_settings(SHARED_CACHE=True)
+    def test_list_not_modified_without_recipe_queries(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if 'recipes_recipe' in query['sql']
+        ])
+
+    def test_list_etag_changes_with_recipes(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        recipe = Recipe.objects.get(pk=self.dataset['ids']['own'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f'/api/recipes/{recipe.pk}/',
+                {'name': 'Новое название', 'text': recipe.text,
+                 'cooking_time': recipe.cooking_time,
+                 'image': 'data:image/png;base64,'
+                          + base64.b64encode(PNG).decode(),
+                 'tags': [tag.id for tag in self.dataset['tags'][:1]],
+                 'ingredients': [
+                     {'id': self.dataset['ingredients'][0].id, 'amount': 1}]},
+                format='json')
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def get(self, worker, path, etag=''):
+        with override_settings(CACHES=WORKER_CACHES[worker]):
+            return self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_process_local_cache(self):
+        recipe = self.dataset['ids']['recipe']
+        paths = ('/api/recipes/', f'/api/recipes/{recipe}/')
+        etags = {path: self.get('worker-b', path)['ETag'] for path in paths}
+        for path, etag in etags.items():
+            self.assertEqual(self.get('worker-b', path, etag).status_code,
+                             304)
+        with override_settings(CACHES=WORKER_CACHES['worker-a']):
+            self.client.post(f'/api/recipes/{recipe}/favorite/')
+            self.client.delete(f'/api/recipes/{self.dataset["ids"]["own"]}/')
+        for path, etag in etags.items():
+            with self.subTest(path=path):
+                self.assertEqual(
+                    self.get('worker-b', path, etag).status_code, 200)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_process_local_list_validator(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len([
+            query for query in queries.captured_queries
+            if 'recipes_recipe' in query['sql']
+        ]), 1)
+
+    def test_detail_ignores_if_modified_since(self):
+        path = f'/api/recipes/{self.dataset["ids"]["recipe"]}/'
+        last_modified = self.client.get(path)['Last-Modified']
+        response = self.client.get(
+            path, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_etag_changes_with_catalog(self):
+        recipe = Recipe.objects.get(pk=self.dataset['ids']['recipe'])
+        path = f'/api/recipes/{recipe.pk}/'
+        etag = self.client.get(path)['ETag']
+        ingredient = recipe.ingredients.first()
+        ingredient.name = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Новое название', response.content.decode())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WORKERS=0)
+class AnonymousCacheTest(TestCase):
+    """ Кэш ответов анонимным пользователям (AnonymousCacheMixin). """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = create_dataset(1)
+        # Копии изображения считаются готовыми, сохранение их не строит.
+        Recipe.objects.update(
+            image_variants={'source': 'recipes/placeholder.png'})
+        cls.recipe = Recipe.objects.get(pk=cls.dataset['ids']['recipe'])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.path = f'/api/recipes/{self.recipe.pk}/'
+
+    def names(self):
+        listed = [recipe['name'] for recipe in self.client.get(
+            '/api/recipes/', {'limit': 100}).json()['results']]
+        return self.client.get(self.path).json()['name'], listed
+
+    def rename(self, name):
+        self.recipe.name = name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save(update_fields=['name'])
+
+    def rename_quietly(self, name):
+        """ Изменение без сигналов: версии рецепта остаются прежними. """
+        Recipe.objects.filter(pk=self.recipe.pk).update(name=name)
+
+    def test_second_request_hit(self):
+        name, listed = self.names()
+        self.rename_quietly('Другое название')
+        self.assertEqual(self.names(), (name, listed))
+
+    def test_miss_after_write(self):
+        self.names()
+        self.rename('Другое название')
+        name, listed = self.names()
+        self.assertEqual(name, 'Другое название')
+        self.assertIn('Другое название', listed)
+
+    def test_stale_while_locked(self):
+        name, _ = self.names()
+        request = Request(APIRequestFactory().get(self.path))
+        request.accepted_renderer = JSONRenderer()
+        lock = f'{AnonymousCacheMixin().get_anonymous_cache_key(request)}:lock'
+        self.assertTrue(cache.add(lock, True))
+        self.rename('Другое название')
+        self.assertEqual(self.client.get(self.path).json()['name'], name)
+        self.assertFalse(cache.add(lock, True))
+        cache.delete(lock)
+        self.assertEqual(
+            self.client.get(self.path).json()['name'], 'Другое название')
+
+    def test_authenticated_not_cached(self):
+        self.client.force_authenticate(self.dataset['user'])
+        self.names()
+        self.rename_quietly('Другое название')
+        self.assertEqual(self.names()[0], 'Другое название')
+        self.client.force_authenticate(None)
+        self.assertEqual(self.names()[0], 'Другое название')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WORKERS=0)
+class BatchTogglesTest(TestCase):
+    """ Пакетное удаление: счётчики избранного и отметки пользователя. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = create_dataset(1)
+        cls.token = Token.objects.create(user=cls.dataset['user'])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_favorite_batch_remove(self):
+        batch = {'recipes': self.dataset['batch']}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/recipes/favorite/', batch, format='json')
+        self.assertTrue(self.client.get(
+            f'/api/recipes/{batch["recipes"][0]}/').json()['is_favorited'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                '/api/recipes/favorite/', batch, format='json')
+        self.assertEqual(
+            {item['status'] for item in response.json()['results']},
+            {'removed'})
+        self.assertFalse(Favorite.objects.filter(
+            user=self.dataset['user'], recipe__in=batch['recipes']).exists())
+        counts = Recipe.objects.filter(pk__in=batch['recipes']).values_list(
+            'favorites_count', flat=True)
+        self.assertEqual(set(counts), {0})
+        self.assertFalse(self.client.get(
+            f'/api/recipes/{batch["recipes"][0]}/').json()['is_favorited'])
+
+    def test_queryset_delete(self):
+        """ Удаление вне remove_recipes (админка) меняет счётчик сигналом. """
+        batch = self.dataset['batch']
+        self.client.post(
+            '/api/recipes/favorite/', {'recipes': batch}, format='json')
+        Favorite.objects.filter(recipe__in=batch[:2]).delete()
+        counts = dict(Recipe.objects.filter(pk__in=batch[:3]).values_list(
+            'id', 'favorites_count'))
+        self.assertEqual(counts, {batch[0]: 0, batch[1]: 0, batch[2]: 1})
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WORKERS=0)
+class RecipeTagsTest(TestCase):
+    """ Теги рецептов, записанных через API, и фильтр по ним. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = create_dataset(1)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.dataset['user'])
+
+    def save(self, method, path, tags):
+        response = getattr(self.client, method)(path, {
+            'name': 'Рецепт с тегами', 'text': 'Описание', 'cooking_time': 5,
+            'image': 'data:image/png;base64,' + base64.b64encode(PNG).decode(),
+            'tags': [tag.id for tag in tags],
+            'ingredients': [
+                {'id': self.dataset['ingredients'][0].id, 'amount': 1}],
+        }, format='json')
+        self.assertIn(response.status_code, (200, 201))
+        self.assertEqual([tag['id'] for tag in response.json()['tags']],
+                         [tag.id for tag in tags])
+        return response.json()['id']
+
+    def found(self, recipe_id, tag):
+        response = self.client.get(
+            f'/api/recipes/?tags={tag.slug}&limit=100')
+        return recipe_id in [row['id'] for row in response.json()['results']]
+
+    def test_filter_after_create_and_update(self):
+        breakfast, lunch, dinner = self.dataset['tags']
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe_id = self.save('post', '/api/recipes/', [breakfast])
+        self.assertTrue(self.found(recipe_id, breakfast))
+        self.assertFalse(self.found(recipe_id, dinner))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.save('patch', f'/api/recipes/{recipe_id}/', [lunch, dinner])
+        self.assertFalse(self.found(recipe_id, breakfast))
+        self.assertTrue(self.found(recipe_id, dinner))
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe_id).tag_mask,
+            1 << (lunch.id - 1) | 1 << (dinner.id - 1))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WORKERS=0)
+class ImageVariantsTest(TestCase):
+    """ Уменьшенные копии изображений рецептов (recipes.images). """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = FoodgramUser.objects.create_user(
+            email='user@example.com', username='user', first_name='Имя',
+            last_name='Фамилия', password='Pass-12345')
+
+    def create_recipe(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.author, name='Суп', text='Описание',
+                cooking_time=10, image=image)
+        recipe.refresh_from_db()
+        return recipe
+
+    def test_build_variants(self):
+        image = default_storage.save('recipes/soup.png', ContentFile(PNG))
+        variants = self.create_recipe(image).image_variants
+        self.assertEqual(variants.pop('source'), image)
+        self.assertEqual(variants.keys(), IMAGE_VARIANTS.keys())
+        for name, (_, image_format, _) in IMAGE_VARIANTS.items():
+            with default_storage.open(variants[name]) as file:
+                self.assertEqual(Image.open(file).format, image_format)
+
+    def test_failure_logged(self):
+        with self.assertLogs('recipes.images', 'ERROR') as logs:
+            recipe = self.create_recipe('recipes/missing.png')
+        self.assertIn(f'изображения рецепта {recipe.pk}', logs.output[0])
+        self.assertEqual(recipe.image_variants, {})
+
+    @override_settings(IMAGE_VARIANT_WORKERS=1)
+    def test_worker_failure_logged(self):
+        with mock.patch('recipes.images.build_image_variants',
+                        side_effect=OSError('broken image')):
+            with self.assertLogs('recipes.images', 'ERROR') as logs:
+                recipe = self.create_recipe('recipes/soup.png')
+                executor, images._executor = images._executor, None
+                executor.shutdown(wait=True)
+        self.assertIn(f'изображения рецепта {recipe.pk}', logs.output[0])
+        self.assertIn('broken image', logs.output[0])
+
+
+class LoadModelsTest(TestCase):
+    """ Загрузка справочников командой loadmodels. """
+
+    def load(self, content, extension, *args):
+        path = os.path.join(MEDIA_ROOT, f'catalog.{extension}')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        stdout = StringIO()
+        call_command('loadmodels', '--path', path, *args, stdout=stdout)
+        return stdout.getvalue().splitlines()[-1]
+
+    def ingredients(self):
+        return set(Ingredient.objects.values_list(
+            'name', 'measurement_unit'))
+
+    def test_csv(self):
+        self.assertEqual(self.load(
+            'name,measurement_unit\nсоль,г\nмука,кг\n', 'csv'),
+            'Ingredient: добавлено 2, удалено 0.')
+        self.assertEqual(self.ingredients(), {('соль', 'г'), ('мука', 'кг')})
+
+    def test_json(self):
+        path = os.path.join(
+            settings.BASE_DIR, 'recipes', 'data', 'ingredients.json')
+        with open(path, encoding='utf-8') as file:
+            expected = {(row['name'], row['measurement_unit'])
+                        for row in json.load(file)}
+        call_command('loadmodels', '--path', path, stdout=StringIO())
+        self.assertEqual(self.ingredients(), expected)
+        self.assertEqual(self.load(json.dumps([
+            {'name': 'Завтрак', 'color': '#E26C2D', 'slug': 'breakfast'},
+        ]), 'json'), 'Tag: добавлено 1, удалено 0.')
+        self.assertEqual(
+            list(Tag.objects.values_list('name', 'color', 'slug')),
+            [('Завтрак', '#E26C2D', 'breakfast')])
+
+    def test_rerun(self):
+        content = 'соль,г\nмука,кг\nсоль,г\n'
+        self.assertEqual(self.load(content, 'csv'),
+                         'Ingredient: добавлено 2, удалено 0.')
+        for args in ((), ('--sync', )):
+            self.assertEqual(self.load(content, 'csv', *args),
+                             'Ingredient: добавлено 0, удалено 0.')
+        self.assertEqual(self.ingredients(), {('соль', 'г'), ('мука', 'кг')})
+
+    def test_sync(self):
+        self.load('соль,г\nмука,кг\nсахар,г\n', 'csv')
+        self.load('Завтрак,#E26C2D,breakfast\nУжин,#8775D2,dinner\n', 'csv')
+        author = FoodgramUser.objects.create_user(
+            email='user@example.com', username='user', first_name='Имя',
+            last_name='Фамилия', password='Pass-12345')
+        recipe = Recipe.objects.create(
+            author=author, name='Суп', text='Описание', cooking_time=10)
+        recipe.tags.set(Tag.objects.all())
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in Ingredient.objects.all())
+        self.assertEqual(
+            self.load('соль,г\nсахар,г\nвода,мл\n', 'csv', '--sync'),
+            'Ingredient: добавлено 1, удалено 1.')
+        self.assertEqual(
+            self.load('Ужин,#8775D2,dinner\n', 'csv', '--sync'),
+            'Tag: добавлено 0, удалено 1.')
+        self.assertEqual(self.ingredients(),
+                         {('соль', 'г'), ('сахар', 'г'), ('вода', 'мл')})
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        self.assertEqual(
+            set(recipe.ingredientamount_set.values_list(
+                'ingredient__name', flat=True)), {'соль', 'сахар'})
+        self.assertEqual(
+            list(recipe.tags.values_list('slug', flat=True)), ['dinner'])
+
+
+class ShoppingListTest(TestCase):
+    """ Выгрузка списка покупок. """
+
+    def setUp(self):
+        user = FoodgramUser.objects.create_user(
+            email='user@example.com', username='user', first_name='Имя',
+            last_name='Фамилия', password='Pass-12345')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_default_format(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+
+    @override_settings(SHOPPING_LIST_FONT='/nonexistent/font.ttf')
+    def test_pdf_without_font(self):
+        with self.assertLogs('api.renderers', 'ERROR'):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/?format=pdf')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('format=txt', response.json()['detail'])
+
+
+@skipUnless(os.path.exists(settings.SHOPPING_LIST_FONT),
+            'нет шрифта SHOPPING_LIST_FONT')
+class PDFDocumentTest(SimpleTestCase):
+    """ Запись PDF и подмножество шрифта (api.pdf). """
+
+    TEXT = 'Cписок покупок: Йогурт ёлка - 10 г'
+
+    def setUp(self):
+        self.font = load_font(settings.SHOPPING_LIST_FONT)
+
+    def render(self, font, text):
+        image = Image.new('L', (800, 60))
+        ImageDraw.Draw(image).text(
+            (5, 5), text, font=ImageFont.truetype(BytesIO(font), 32),
+            fill=255)
+        return image
+
+    def test_subset(self):
+        """ Глифы подмножества рисуются так же, как в полном шрифте. """
+        with open(settings.SHOPPING_LIST_FONT, 'rb') as file:
+            original = file.read()
+        subset = self.font.subset(
+            {self.font.glyph(char) for char in self.TEXT})
+        self.assertLess(len(subset), len(original) // 4)
+        self.assertEqual(checksum(subset), 0xB1B0AFBA)
+        # Символы для отрисовки берутся из cmap исходного шрифта.
+        tables = {
+            tag: data[offset:offset + length]
+            for data, tags in ((original, ('cmap', )), (subset, None))
+            for tag, (offset, length) in TrueTypeFont._read_tables(
+                data).items()
+            if tags is None or tag in tags
+        }
+        font = write_font(tables)
+        self.assertEqual(self.render(font, self.TEXT).tobytes(),
+                         self.render(original, self.TEXT).tobytes())
+        self.assertIsNone(self.render(font, 'Z').getbbox())
+
+    def test_document(self):
+        lines = [self.TEXT] * 100 + ['слово ' * 60]
+        pdf = b''.join(PDFDocument(self.font).render(lines))
+        self.assertTrue(pdf.startswith(b'%PDF-1.4\n'))
+        self.assertTrue(pdf.endswith(b'%%EOF\n'))
+        self.assertLess(len(pdf), 20000)
+        start = int(pdf.rsplit(b'startxref\n', 1)[1].split()[0])
+        xref = pdf[start:].split(b'trailer')[0].splitlines()
+        self.assertEqual(xref[0], b'xref')
+        for number, entry in enumerate(xref[3:], 1):
+            offset = int(entry.split()[0])
+            self.assertTrue(pdf[offset:].startswith(b'%d 0 obj' % number))
+        self.assertIn(b'/Count 3 >>', pdf)
+        self.assertIn(b'<%04X> <0419>' % self.font.glyph('Й'), pdf)
+        program = re.search(
+            rb'/Length (\d+) /Length1 (\d+) /Filter /FlateDecode >>\n'
+            rb'stream\n', pdf)
+        data = pdf[program.end():program.end() + int(program[1])]
+        self.assertEqual(len(zlib.decompress(data)), int(program[2]))
+
+
+class TokenCacheTest(TestCase):
+    """ Кэш токенов (CachedTokenAuthentication) и SHARED_CACHE. """
+
+    @classmethod
+    def setUpTestData(cls):
+        user = FoodgramUser.objects.create_user(
+            email='user@example.com', username='user', first_name='Имя',
+            last_name='Фамилия', password='Pass-12345')
+        cls.token = Token.objects.create(user=user)
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def token_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        return len([query for query in queries.captured_queries
+                    if 'authtoken_token' in query['sql']])
+
+    @override_settings(SHARED_CACHE=True)
+    def test_shared_cache(self):
+        self.assertEqual(self.token_queries(), 1)
+        self.assertEqual(self.token_queries(), 0)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_process_local_cache(self):
+        self.assertEqual(self.token_queries(), 1)
+        self.assertEqual(self.token_queries(), 1)
+
+
+class CatalogVersionTest(TestCase):
+    """ Кэш справочников и индекс ингредиентов (api.indexes). """
+
+    def setUp(self):
+        cache.clear()
+
+    def change_elsewhere(self):
+        """ Изменение, о котором кэш этого процесса не знает. """
+        get_ingredient_index()
+        self.client.get('/api/tags/')
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='шафран', measurement_unit='г')])
+        Tag.objects.bulk_create(
+            [Tag(name='Десерт', color='#FFFFFF', slug='dessert')])
+        return (
+            [row['name'] for row in get_ingredient_index().search(['шаф'])],
+            [tag['slug'] for tag in self.client.get('/api/tags/').json()],
+        )
+
+    @override_settings(SHARED_CACHE=True)
+    def test_shared_cache(self):
+        self.assertEqual(self.change_elsewhere(), ([], []))
+
+    @override_settings(SHARED_CACHE=False, CATALOG_LOCAL_TIMEOUT=0)
+    def test_process_local_cache(self):
+        self.assertEqual(self.change_elsewhere(), (['шафран'], ['dessert']))
+
+    @override_settings(SHARED_CACHE=False, CATALOG_LOCAL_TIMEOUT=0)
+    def test_version_does_not_expire(self):
+        self.assertEqual(get_catalog_version(), get_catalog_version())
+
+
+class MembershipCacheTest(TransactionTestCase):
+    """
+    Отметки пользователя, когда у каждого процесса свой кэш.
+    TransactionTestCase: внутри транзакции кэш отметок не используется.
+    """
+
+    def setUp(self):
+        user = FoodgramUser.objects.create_user(
+            email='user@example.com', username='user', first_name='Имя',
+            last_name='Фамилия', password='Pass-12345')
+        self.recipe = Recipe.objects.create(
+            author=user, name='Суп', text='Описание', cooking_time=10,
+            image='recipes/placeholder.png')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        for caches in WORKER_CACHES.values():
+            with override_settings(CACHES=caches):
+                cache.clear()
+
+    def is_favorited(self, worker):
+        with override_settings(CACHES=WORKER_CACHES[worker]):
+            return self.client.get(
+                f'/api/recipes/{self.recipe.pk}/').json()['is_favorited']
+
+    @override_settings(SHARED_CACHE=False)
+    def test_process_local_cache(self):
+        self.assertFalse(self.is_favorited('worker-a'))
+        self.assertFalse(self.is_favorited('worker-b'))
+        with override_settings(CACHES=WORKER_CACHES['worker-a']):
+            self.client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertTrue(self.is_favorited('worker-b'))
+
+    @override_settings(SHARED_CACHE=True)
+    def test_shared_cache(self):
+        self.assertFalse(self.is_favorited('worker-a'))
+        with override_settings(CACHES=WORKER_CACHES['worker-a']):
+            self.client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertTrue(self.is_favorited('worker-a'))
+
+
+class ReplicaStickyTest(SimpleTestCase):
+    """ Чтение из default после записи (ReplicaMiddleware). """
+
+    @override_settings(SHARED_CACHE=False, DATABASES={
+        **settings.DATABASES, 'replica_0': settings.DATABASES['default']})
+    def test_sticky_cookie(self):
+        reads = []
+
+        def view(request):
+            reads.append(_read_replica.get())
+            return HttpResponse()
+
+        middleware = ReplicaMiddleware(view)
+        factory = RequestFactory()
+        cookie = middleware(factory.post('/')).cookies[STICKY_COOKIE]
+        sticky = factory.get('/')
+        sticky.COOKIES[STICKY_COOKIE] = cookie.value
+        middleware(sticky)
+        forged = factory.get('/')
+        forged.COOKIES[STICKY_COOKIE] = '1'
+        middleware(forged)
+        self.assertEqual(reads, [False, False, True])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WORKERS=0)
+class AsyncViewsTest(TestCase):
+    """ Ответы api.async_views совпадают с ответами представлений DRF. """
+
+    HEADERS = ('Content-Type', 'Allow', 'Vary', 'WWW-Authenticate', 'ETag')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = create_dataset(1)
+        cls.token = Token.objects.create(user=cls.dataset['user'])
+
+    def setUp(self):
+        cache.clear()
+        self.auth = {'Authorization': f'Token {self.token.key}'}
+
+    async def compare(self, async_view, sync_view, method, path,
+                      headers=None, **kwargs):
+        """ Ответ async_view, совпадающий с ответом sync_view. """
+        headers = headers or {}
+        sync_response = await sync_to_async(sync_view)(
+            getattr(RequestFactory(), method)(path, headers=headers),
+            **kwargs)
+        response = await async_view(
+            getattr(AsyncRequestFactory(), method)(path, headers=headers),
+            **kwargs)
+        for rendered in (response, sync_response):
+            if hasattr(rendered, 'render'):
+                rendered.render()
+        self.assertEqual(
+            (response.status_code, response.content,
+             {name: response.get(name) for name in self.HEADERS}),
+            (sync_response.status_code, sync_response.content,
+             {name: sync_response.get(name) for name in self.HEADERS}))
+        return response
+
+    async def test_matches_sync_views(self):
+        recipe = self.dataset['ids']['recipe']
+        favorite = f'/api/recipes/{recipe}/favorite/'
+        cases = (
+            (async_views.favorite, FavoriteView.as_view(), 'post',
+             favorite, {}, recipe),
+            (async_views.favorite, FavoriteView.as_view(), 'post',
+             favorite, {'Authorization': 'Token nope'}, recipe),
+            (async_views.favorite, FavoriteView.as_view(), 'delete',
+             favorite, self.auth, recipe),
+            (async_views.favorite, FavoriteView.as_view(), 'post',
+             '/api/recipes/0/favorite/', self.auth, 0),
+            (async_views.shopping_cart, ShoppingCartView.as_view(), 'post',
+             '/api/recipes/0/shopping_cart/', self.auth, 0),
+        )
+        for async_view, sync_view, method, path, headers, id in cases:
+            with self.subTest(method=method, path=path, headers=headers):
+                await self.compare(async_view, sync_view, method, path,
+                                   headers, id=id)
+        tags = TagViewSet.as_view({'get': 'list'}, suffix='List')
+        response = await self.compare(
+            async_views.tag_list, tags, 'get', '/api/tags/')
+        browsable = await async_views.tag_list(
+            AsyncRequestFactory().get('/api/tags/?format=api'))
+        self.assertEqual(browsable['Content-Type'],
+                         'text/html; charset=utf-8')
+        response = await self.compare(
+            async_views.tag_list, tags, 'get', '/api/tags/',
+            {'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_toggle(self):
+        recipe = self.dataset['ids']['recipe']
+        factory = AsyncRequestFactory()
+        path = f'/api/recipes/{recipe}/favorite/'
+        statuses = []
+        for method in ('post', 'post', 'delete', 'delete'):
+            response = await async_views.favorite(
+                getattr(factory, method)(path, headers=self.auth), id=recipe)
+            statuses.append(response.status_code)
+        self.assertEqual(statuses, [201, 400, 204, 400])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WORKERS=0)
+class FastSerializationTest(TestCase):
+    """ Ответы api.representations совпадают с ответами сериализаторов. """
+
+    PATHS = (
+        ('anon', '/api/recipes/'),
+        ('auth', '/api/recipes/'),
+        ('auth', '/api/recipes/?limit=3&page=2'),
+        ('auth', '/api/recipes/?cursor=&limit=5'),
+        ('auth', '/api/recipes/?tags=lunch&is_favorited=1'),
+        ('auth', '/api/recipes/?search=суп&cursor='),
+        ('anon', '/api/recipes/{recipe}/'),
+        ('auth', '/api/recipes/{recipe}/'),
+        ('auth', '/api/recipes/0/'),
+        ('auth', '/api/users/subscriptions/'),
+        ('auth', '/api/users/subscriptions/?recipes_limit=2&cursor='),
+        ('auth', '/api/users/subscriptions/?recipes_limit=1&limit=1&page=2'),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = create_dataset(1)
+        Recipe.objects.filter(pk=cls.dataset['ids']['recipe']).update(
+            image_variants={'card': 'recipes/variants/card.jpg'})
+        cls.token = Token.objects.create(user=cls.dataset['user'])
+
+    def setUp(self):
+        self.clients = {'anon': APIClient(), 'auth': APIClient()}
+        self.clients['auth'].credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def request(self, fast, client, method, path):
+        cache.clear()
+        with override_settings(FAST_SERIALIZATION=fast):
+            response = getattr(self.clients[client], method)(
+                path.format(**self.dataset['ids']))
+        return response.status_code, response.content
+
+    def test_same_content(self):
+        for client, path in self.PATHS:
+            with self.subTest(client=client, path=path):
+                self.assertEqual(
+                    self.request(True, client, 'get', path),
+                    self.request(False, client, 'get', path))
+
+    def test_retrieve_invalid_id(self):
+        class FastView(FastRecipeReadMixin, viewsets.ReadOnlyModelViewSet):
+            queryset = Recipe.objects.all()
+            permission_classes = [AllowAny]
+
+        view = FastView.as_view({'get': 'retrieve'})
+        for pk in ('abc', '0'):
+            with self.subTest(pk=pk):
+                response = view(APIRequestFactory().get('/'), pk=pk)
+                self.assertEqual(response.status_code, 404)
+
+    def test_same_toggle_content(self):
+        for path in ('/api/recipes/{recipe}/favorite/',
+                     '/api/recipes/{recipe}/shopping_cart/',
+                     '/api/users/{author}/subscribe/?recipes_limit=2'):
+            with self.subTest(path=path):
+                self.request(True, 'auth', 'delete', path)
+                fast = self.request(True, 'auth', 'post', path)
+                self.request(True, 'auth', 'delete', path)
+                self.assertEqual(
+                    fast, self.request(False, 'auth', 'post', path))
+                self.assertEqual(fast[0], 201)
+
+
+class RepeatedQueriesTest(TestCase):
+    """ Отпечатки запросов и отчёт о N+1. """
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s) AND x = 1'),
+            fingerprint("SELECT * FROM t WHERE id IN (%s)  AND x = 'a'"))
+        self.assertEqual(
+            fingerprint('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)'),
+            'INSERT INTO t (a, b) VALUES (...)')
+
+    def test_serializer_field_reported(self):
+        class AuthorSerializer(serializers.ModelSerializer):
+            author_email = serializers.SerializerMethodField()
+
+            class Meta:
+                model = Recipe
+                fields = ('id', 'author_email')
+
+            def get_author_email(self, recipe):
+                return recipe.author.email
+
+        create_dataset(1)
+        with track_queries(threshold=5) as tracker:
+            AuthorSerializer(Recipe.objects.all(), many=True).data
+        (query, count), = tracker.repeated()
+        self.assertEqual(count, Recipe.objects.count())
+        report = tracker.report('test')
+        self.assertIn('поле AuthorSerializer.author_email', report)
+        self.assertIn('api/tests.py', report)
+
+
+class MetricsTest(TestCase):
+    """ Замеры запросов (foodgram.metrics). """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = FoodgramUser.objects.create_user(
+            email='user@example.com', username='user', first_name='Имя',
+            last_name='Фамилия', password='Pass-12345')
+        cls.staff = FoodgramUser.objects.create_user(
+            email='staff@example.com', username='staff', first_name='Имя',
+            last_name='Фамилия', password='Pass-12345', is_staff=True)
+        Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def serializer_total(self, view):
+        histogram = registry.histograms[
+            'foodgram_serializer_duration_seconds']
+        return histogram.get(view, (None, 0.0))[1]
+
+    @override_settings(REQUEST_METRICS=False)
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            RequestMetricsMiddleware(lambda request: HttpResponse())
+        response = self.client.get('/api/tags/')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(REQUEST_METRICS=True)
+    def test_server_timing(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/tags/'))
+        self.client.force_authenticate(self.user)
+        self.assertNotIn('Server-Timing', self.client.get('/api/tags/'))
+        self.client.force_authenticate(self.staff)
+        cache.clear()
+        serialized = self.serializer_total('TagViewSet.list')
+        timing = self.client.get('/api/tags/')['Server-Timing']
+        self.assertTrue(timing.startswith('view;desc="TagViewSet.list", '))
+        self.assertIn('queries", serializer;dur=', timing)
+        self.assertGreater(
+            self.serializer_total('TagViewSet.list'), serialized)
+
+    @override_settings(REQUEST_METRICS=True, DEBUG=True)
+    def test_server_timing_debug(self):
+        self.assertIn('Server-Timing', self.client.get('/api/recipes/'))
+
+    def test_exposition(self):
+        metrics = RequestMetrics()
+        metrics.total, metrics.sql, metrics.queries = 0.03, 0.001, 3
+        test_registry = Registry()
+        test_registry.observe('Recipe"View', 200, metrics)
+        test_registry.observe('Recipe"View', 200, metrics)
+        test_registry.observe('Recipe"View', 404, RequestMetrics())
+        lines = test_registry.render().splitlines()
+        label = 'view="Recipe\\"View"'
+        for line in (
+            '# TYPE foodgram_request_duration_seconds histogram',
+            f'foodgram_request_duration_seconds_bucket{{{label},le="0.005"}}'
+            ' 1',
+            f'foodgram_request_duration_seconds_bucket{{{label},le="0.025"}}'
+            ' 1',
+            f'foodgram_request_duration_seconds_bucket{{{label},le="0.05"}}'
+            ' 3',
+            f'foodgram_request_duration_seconds_bucket{{{label},le="+Inf"}}'
+            ' 3',
+            f'foodgram_request_duration_seconds_sum{{{label}}} 0.06',
+            f'foodgram_request_duration_seconds_count{{{label}}} 3',
+            f'foodgram_sql_queries_bucket{{{label},le="2"}} 1',
+            f'foodgram_sql_queries_bucket{{{label},le="5"}} 3',
+            '# TYPE foodgram_requests_total counter',
+            f'foodgram_requests_total{{{label},status="200"}} 2',
+            f'foodgram_requests_total{{{label},status="404"}} 1',
+        ):
+            self.assertIn(line, lines)
+
+    def test_endpoint(self):
+        factory = APIRequestFactory()
+        for user, status_code in ((None, 401), (self.user, 403),
+                                  (self.staff, 200)):
+            request = factory.get('/api/metrics/')
+            if user is not None:
+                force_authenticate(request, user)
+            response = metrics(request)
+            response.render()
+            self.assertEqual(response.status_code, status_code)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertTrue(response.content.decode().startswith(
+            '# HELP foodgram_request_duration_seconds '))
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
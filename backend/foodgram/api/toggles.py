@@ -0,0 +1,67 @@
+from django.db import IntegrityError, router, transaction
+from django.db.models.deletion import Collector
+
+from recipes.counters import BatchDeletion, update_favorites_count
+from recipes.membership import bump_membership_version
+from recipes.models import Favorite
+
+
+def add_relation(model, **fields):
+    """
+    Создаёт запись одним INSERT. Повторное добавление, в том числе
+    одновременное, отсекает ограничение уникальности в базе данных:
+    вместо предварительной проверки возвращается None.
+    """
+    try:
+        with transaction.atomic():
+            return model.objects.create(**fields)
+    except IntegrityError:
+        return None
+
+
+def remove_relation(model, **fields):
+    """ Удаляет запись; False, если удалять было нечего. """
+    deleted, _ = model.objects.filter(**fields).delete()
+    return deleted > 0
+
+
+def recipes_changed(model, user, recipe_ids):
+    """
+    То, что для одной записи делают сигналы post_save и post_delete:
+    новая версия отметок пользователя и счётчики избранного.
+    """
+    bump_membership_version(user.pk)
+    if model is Favorite:
+        update_favorites_count(recipe_ids)
+
+
+def add_recipes(model, user, recipe_ids):
+    """
+    Добавляет рецепты в избранное или корзину одним
+    INSERT ... ON CONFLICT DO NOTHING.
+    """
+    with transaction.atomic():
+        model.objects.bulk_create(
+            [model(user=user, recipe_id=pk) for pk in recipe_ids],
+            ignore_conflicts=True
+        )
+        recipes_changed(model, user, recipe_ids)
+
+
+def remove_recipes(model, user, recipe_ids):
+    """
+    Удаляет рецепты из избранного или корзины одним DELETE, как
+    QuerySet.delete(). Сигналы post_delete с источником BatchDeletion
+    не пересчитывают счётчик избранного по одному рецепту: это и новую
+    версию отметок делает recipes_changed.
+    """
+    if not recipe_ids:
+        return
+    using = router.db_for_write(model)
+    queryset = model.objects.using(using).filter(
+        user=user, recipe_id__in=recipe_ids)
+    collector = Collector(using=using, origin=BatchDeletion(queryset))
+    with transaction.atomic(using=using):
+        collector.collect(queryset)
+        collector.delete()
+        recipes_changed(model, user, recipe_ids)
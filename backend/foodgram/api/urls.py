@@ -1,9 +1,11 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (FavoriteView, IngredientViewSet, RecipeViewSet,
-                    ShoppingCartView, ShowSubscriptionsView, SubscribeView,
-                    TagViewSet, download_shopping_cart)
+from .views import (FavoriteBatchView, FavoriteView, IngredientViewSet,
+                    RecipeViewSet, ShoppingCartBatchView, ShoppingCartView,
+                    ShowSubscriptionsView, SubscribeView, TagViewSet,
+                    download_shopping_cart, metrics)
 
 app_name = 'api'
 
@@ -13,25 +15,57 @@ router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('tags', TagViewSet, basename='tags')
 
-urlpatterns = [
+if settings.ASYNC_API:
+    from . import async_views
+
+    shopping_cart_view = async_views.shopping_cart
+    favorite_view = async_views.favorite
+    subscribe_view = async_views.subscribe
+    catalog_urls = [
+        path('ingredients/', async_views.ingredient_list,
+             name='ingredients-list'),
+        path('tags/', async_views.tag_list, name='tags-list'),
+    ]
+else:
+    shopping_cart_view = ShoppingCartView.as_view()
+    favorite_view = FavoriteView.as_view()
+    subscribe_view = SubscribeView.as_view()
+    catalog_urls = []
+
+if settings.REQUEST_METRICS:
+    metrics_urls = [path('metrics/', metrics, name='metrics')]
+else:
+    metrics_urls = []
+
+urlpatterns = catalog_urls + metrics_urls + [
     path(
         'recipes/download_shopping_cart/',
         download_shopping_cart,
         name='download_shopping_cart'
     ),
+    path(
+        'recipes/shopping_cart/',
+        ShoppingCartBatchView.as_view(),
+        name='shopping_cart_batch'
+    ),
+    path(
+        'recipes/favorite/',
+        FavoriteBatchView.as_view(),
+        name='favorite_batch'
+    ),
     path(
         'recipes/<int:id>/shopping_cart/',
-        ShoppingCartView.as_view(),
+        shopping_cart_view,
         name='shopping_cart'
     ),
     path(
         'recipes/<int:id>/favorite/',
-        FavoriteView.as_view(),
+        favorite_view,
         name='favorite'
     ),
     path(
         'users/<int:id>/subscribe/',
-        SubscribeView.as_view(),
+        subscribe_view,
         name='subscribe'
     ),
     path(
@@ -1,55 +1,68 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch, Sum,
+                              Value)
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
-from rest_framework.decorators import api_view
+from rest_framework.decorators import (api_view, permission_classes,
+                                       renderer_classes)
 from rest_framework.generics import ListAPIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from foodgram.metrics import registry, serializer_timer
 from recipes.models import (Favorite, Ingredient, Recipe, IngredientAmount,
                             ShoppingCart, Tag)
 from users.models import Subscription, FoodgramUser
 
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import CustomPagination
+from .mixins import (AnonymousCacheMixin, CatalogCacheMixin,
+                     ConditionalGetMixin, FastRecipeReadMixin)
+from .pagination import CustomPagination, KeysetPagination, RecipePagination
 from .permissions import IsAuthorOrAdminOrReadOnly
-from .serializers import (CreateRecipeSerializer, FavoriteSerializer,
-                          IngredientSerializer, RecipeSerializer,
-                          ShoppingCartSerializer, ShowSubscriptionsSerializer,
-                          SubscriptionSerializer, TagSerializer)
+from .renderers import (PrometheusRenderer, ShoppingListCSVRenderer,
+                        ShoppingListPDFRenderer, ShoppingListTXTRenderer)
+from .representations import (AUTHOR_FIELDS, recipe_previews,
+                              short_recipe_data, subscription_data,
+                              subscriptions)
+from .serializers import (CreateRecipeSerializer, IngredientSerializer,
+                          RecipeBatchSerializer, RecipeSerializer,
+                          ShowSubscriptionsSerializer, TagSerializer)
+from .toggles import (add_recipes, add_relation, remove_recipes,
+                      remove_relation)
 
 
 class SubscribeView(APIView):
-    """ Операция подписки/отписки. """
+    """
+    Операция подписки/отписки.
+    Подписка — один INSERT, повтор отсекает ограничение уникальности;
+    автор и превью его рецептов загружаются заранее двумя запросами.
+    """
 
     permission_classes = (IsAuthenticated, )
 
     def post(self, request, id):
-        data = {
-            'user': request.user.id,
-            'author': id
-        }
-        serializer = SubscriptionSerializer(
-            data=data,
-            context={'request': request}
-        )
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        recipes = Recipe.objects.defer('search_vector')
+        limit = request.query_params.get('recipes_limit')
+        if limit:
+            recipes = recipes[:int(limit)]
+        author = FoodgramUser.objects.prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='recipes_preview')
+        ).filter(id=id).first()
+        if author is None or add_relation(
+                Subscription, user=request.user, author=author) is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        author.is_subscribed = True
+        return Response(subscription_data(author, request),
+                        status=status.HTTP_201_CREATED)
 
     def delete(self, request, id):
-        author = get_object_or_404(FoodgramUser, id=id)
-        if Subscription.objects.filter(
-           user=request.user, author=author).exists():
-            subscription = get_object_or_404(
-                Subscription, user=request.user, author=author
-            )
-            subscription.delete()
+        if remove_relation(Subscription, user=request.user, author_id=id):
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(FoodgramUser.objects.only('id'), id=id)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -57,50 +70,127 @@ class ShowSubscriptionsView(ListAPIView):
     """ Отображение подписок. """
 
     permission_classes = [IsAuthenticated, ]
-    pagination_class = CustomPagination
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        """
+        Авторы, на которых подписан пользователь.
+        Число рецептов хранится в счётчике автора, а превью рецептов
+        (не больше recipes_limit на автора) загружаются одним запросом
+        с ROW_NUMBER() OVER (PARTITION BY author).
+        """
+        recipes = Recipe.objects.defer('search_vector')
+        limit = self.request.query_params.get('recipes_limit')
+        if limit:
+            recipes = recipes[:int(limit)]
+        return FoodgramUser.objects.filter(
+            author__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='recipes_preview')
+        )
 
     def get(self, request):
-        user = request.user
-        queryset = FoodgramUser.objects.filter(author__user=user)
+        if settings.FAST_SERIALIZATION:
+            return self.get_fast(request)
+        queryset = self.get_queryset()
         page = self.paginate_queryset(queryset)
         serializer = ShowSubscriptionsSerializer(
             page, many=True, context={'request': request}
         )
         return self.get_paginated_response(serializer.data)
 
+    def get_fast(self, request):
+        """ Те же два запроса, но строками values() без сериализаторов. """
+        queryset = self.get_queryset().prefetch_related(None).values(
+            *AUTHOR_FIELDS, 'recipes_count')
+        page = self.paginate_queryset(queryset)
+        previews = recipe_previews(
+            [row['id'] for row in page],
+            request.query_params.get('recipes_limit'))
+        with serializer_timer():
+            data = subscriptions(page, request, previews)
+        return self.get_paginated_response(data)
+
 
 class FavoriteView(APIView):
-    """ Добавление/удаление рецепта из избранного. """
+    """
+    Добавление/удаление рецепта из избранного.
+    Добавление — выборка рецепта и INSERT, удаление — DELETE;
+    повторные и одновременные нажатия не требуют отдельных проверок.
+    """
 
     permission_classes = [IsAuthenticated, ]
     pagination_class = CustomPagination
 
     def post(self, request, id):
-        data = {
-            'user': request.user.id,
-            'recipe': id
-        }
-        if not Favorite.objects.filter(
-           user=request.user, recipe__id=id).exists():
-            serializer = FavoriteSerializer(
-                data=data, context={'request': request}
-            )
-            if serializer.is_valid():
-                serializer.save()
-                return Response(
-                    serializer.data, status=status.HTTP_201_CREATED)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        recipe = Recipe.objects.defer('search_vector').filter(id=id).first()
+        if recipe is None or add_relation(
+                Favorite, user=request.user, recipe=recipe) is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        return Response(short_recipe_data(recipe, request),
+                        status=status.HTTP_201_CREATED)
 
     def delete(self, request, id):
-        recipe = get_object_or_404(Recipe, id=id)
-        if Favorite.objects.filter(
-           user=request.user, recipe=recipe).exists():
-            Favorite.objects.filter(user=request.user, recipe=recipe).delete()
+        if remove_relation(Favorite, user=request.user, recipe_id=id):
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe.objects.only('id'), id=id)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class RecipeBatchView(APIView):
+    """
+    Добавление (POST) и удаление (DELETE) списка рецептов одним запросом:
+    {"recipes": [id, ...]}. Список проверяется одним запросом, изменения
+    записываются одним INSERT или DELETE. В ответе — итог по каждому id
+    и сводка по избранному или корзине после изменения.
+    """
+
+    permission_classes = [IsAuthenticated, ]
+    model = None
+
+    def post(self, request):
+        return self.change(request, add_recipes, 'added', 'exists')
+
+    def delete(self, request):
+        return self.change(request, remove_recipes, 'removed', 'absent')
+
+    def change(self, request, action, changed_status, unchanged_status):
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        found = dict(Recipe.objects.filter(id__in=ids).annotate(
+            marked=Exists(self.model.objects.filter(
+                user=request.user, recipe=OuterRef('pk')))
+        ).values_list('id', 'marked'))
+        adding = action is add_recipes
+        changed = {pk for pk, marked in found.items() if marked != adding}
+        if changed:
+            action(self.model, request.user, sorted(changed))
+        results = [
+            {'id': pk, 'status': (
+                'not_found' if pk not in found
+                else changed_status if pk in changed else unchanged_status
+            )}
+            for pk in ids
+        ]
+        recipes = list(self.model.objects.filter(
+            user=request.user
+        ).order_by('recipe_id').values_list('recipe_id', flat=True))
+        return Response({
+            'results': results,
+            'summary': {'count': len(recipes), 'recipes': recipes},
+        })
+
+
+class FavoriteBatchView(RecipeBatchView):
+    """ Пакетное добавление/удаление рецептов из избранного. """
+
+    model = Favorite
+
+
+class TagViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ Отображение тегов. """
 
     permission_classes = [AllowAny, ]
@@ -109,7 +199,7 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ Отображение ингредиентов. """
 
     permission_classes = [AllowAny, ]
@@ -120,15 +210,32 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ['^name', ]
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                    FastRecipeReadMixin, viewsets.ModelViewSet):
     """ Операции с рецептами: добавление/изменение/удаление/просмотр. """
 
     permission_classes = [IsAuthorOrAdminOrReadOnly, ]
-    pagination_class = CustomPagination
-    queryset = Recipe.objects.all()
+    pagination_class = RecipePagination
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        """
+        Рецепты вместе с автором, тегами и ингредиентами.
+        Флаги избранного, корзины и подписки на автора сериализаторы
+        берут из множеств id пользователя (recipes.membership),
+        поэтому число запросов не зависит от размера страницы.
+        """
+        return Recipe.objects.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredientamount_set',
+                queryset=IngredientAmount.objects.select_related('ingredient')
+            )
+        )
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeSerializer
@@ -146,49 +253,60 @@ class ShoppingCartView(APIView):
     permission_classes = [IsAuthenticated, ]
 
     def post(self, request, id):
-        data = {
-            'user': request.user.id,
-            'recipe': id
-        }
-        recipe = get_object_or_404(Recipe, id=id)
-        if not ShoppingCart.objects.filter(
-           user=request.user, recipe=recipe).exists():
-            serializer = ShoppingCartSerializer(
-                data=data, context={'request': request}
-            )
-            if serializer.is_valid():
-                serializer.save()
-                return Response(
-                    serializer.data, status=status.HTTP_201_CREATED)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        recipe = get_object_or_404(Recipe.objects.defer('search_vector'),
+                                   id=id)
+        if add_relation(ShoppingCart, user=request.user,
+                        recipe=recipe) is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        return Response(short_recipe_data(recipe, request),
+                        status=status.HTTP_201_CREATED)
 
     def delete(self, request, id):
-        recipe = get_object_or_404(Recipe, id=id)
-        if ShoppingCart.objects.filter(
-           user=request.user, recipe=recipe).exists():
-            ShoppingCart.objects.filter(
-                user=request.user, recipe=recipe
-            ).delete()
+        if remove_relation(ShoppingCart, user=request.user, recipe_id=id):
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe.objects.only('id'), id=id)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
+class ShoppingCartBatchView(RecipeBatchView):
+    """ Пакетное добавление рецептов в корзину и их удаление. """
+
+    model = ShoppingCart
+
+
 @api_view(['GET'])
+@permission_classes([IsAuthenticated, ])
+@renderer_classes([ShoppingListTXTRenderer, ShoppingListPDFRenderer,
+                   ShoppingListCSVRenderer])
 def download_shopping_cart(request):
-    ingredient_list = "Cписок покупок:"
+    """
+    Выгрузка списка покупок в формате txt, pdf или csv (?format=).
+    По умолчанию — txt: тот же текст, что отдавался раньше под видом PDF.
+    Ингредиенты суммируются одним запросом и отдаются потоком.
+    """
     ingredients = IngredientAmount.objects.filter(
         recipe__shopping_cart__user=request.user
     ).values(
         'ingredient__name', 'ingredient__measurement_unit'
-    ).annotate(amount=Sum('amount'))
-    for num, i in enumerate(ingredients):
-        ingredient_list += (
-            f"\n{i['ingredient__name']} - "
-            f"{i['amount']} {i['ingredient__measurement_unit']}"
-        )
-        if num < ingredients.count() - 1:
-            ingredient_list += ', '
-    file = 'shopping_list'
-    response = HttpResponse(ingredient_list, 'Content-Type: application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{file}.pdf"'
+    ).annotate(amount=Sum('amount')).order_by(
+        'ingredient__name', 'ingredient__measurement_unit'
+    )
+    renderer = request.accepted_renderer
+    response = StreamingHttpResponse(
+        renderer.stream(ingredients.iterator()),
+        content_type=renderer.content_type
+    )
+    file = f'shopping_list.{renderer.format}'
+    response['Content-Disposition'] = f'attachment; filename="{file}"'
     return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser, ])
+@renderer_classes([PrometheusRenderer])
+def metrics(request):
+    """
+    Гистограммы замеров запросов этого процесса (REQUEST_METRICS).
+    Prometheus обращается с токеном сотрудника в заголовке Authorization.
+    """
+    return Response(registry.render())
@@ -0,0 +1,21 @@
+"""
+ASGI config for foodgram project.
+
+It exposes the ASGI callable as a module-level variable named ``application``
+and switches the toggle and catalog endpoints to the async views
+(``ASYNC_API``), e.g.::
+
+    gunicorn foodgram.asgi:application -k uvicorn.workers.UvicornWorker
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ASYNC_API', 'True')
+
+application = get_asgi_application()
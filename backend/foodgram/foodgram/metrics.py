@@ -0,0 +1,256 @@
+"""
+Замеры запросов (REQUEST_METRICS=True): имя представления, число и время
+SQL-запросов, время сериализации ответа и общее время обработки.
+Сериализация замеряется в собственном коде API: сериализаторы
+api.serializers наследуют TimedSerializerMixin, а ответы без
+сериализаторов (api.representations) строятся внутри serializer_timer().
+Для сотрудников и при DEBUG замеры отдаются в заголовке Server-Timing,
+гистограммы по представлениям — в текстовом формате Prometheus
+на /api/metrics/. Гистограммы свои у каждого процесса.
+Без REQUEST_METRICS промежуточный слой отключается при запуске
+и запросы не замедляет.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                    5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+# Имя гистограммы: (описание, границы корзин, атрибут RequestMetrics).
+HISTOGRAMS = {
+    'foodgram_request_duration_seconds': (
+        'Время обработки запроса', DURATION_BUCKETS, 'total'),
+    'foodgram_sql_duration_seconds': (
+        'Время SQL-запросов за запрос', DURATION_BUCKETS, 'sql'),
+    'foodgram_sql_queries': (
+        'Число SQL-запросов за запрос', QUERY_BUCKETS, 'queries'),
+    'foodgram_serializer_duration_seconds': (
+        'Время сериализаторов за запрос', DURATION_BUCKETS, 'serializer'),
+}
+REQUESTS_TOTAL = 'foodgram_requests_total'
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """ Замеры одного запроса. """
+
+    __slots__ = ('queries', 'sql', 'serializer', 'total', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = self.serializer = self.total = 0.0
+        self.serializing = False
+
+    def server_timing(self, view):
+        return (
+            f'view;desc="{view}", '
+            f'sql;dur={self.sql * 1000:.1f};desc="{self.queries} queries", '
+            f'serializer;dur={self.serializer * 1000:.1f}, '
+            f'total;dur={self.total * 1000:.1f}'
+        )
+
+
+class Registry:
+    """ Гистограммы и счётчики ответов по представлениям. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {name: {} for name in HISTOGRAMS}
+        self.responses = {}
+
+    def observe(self, view, status_code, metrics):
+        with self.lock:
+            for name, (_, buckets, attribute) in HISTOGRAMS.items():
+                value = getattr(metrics, attribute)
+                counts, total = self.histograms[name].get(
+                    view, ([0] * (len(buckets) + 1), 0))
+                counts[bisect_left(buckets, value)] += 1
+                self.histograms[name][view] = (counts, total + value)
+            key = (view, status_code)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def render(self):
+        """ Текстовый формат Prometheus 0.0.4. """
+        with self.lock:
+            lines = []
+            for name, (description, buckets, _) in HISTOGRAMS.items():
+                lines += [f'# HELP {name} {description}',
+                          f'# TYPE {name} histogram']
+                for view, (counts, total) in sorted(
+                        self.histograms[name].items()):
+                    label = f'view="{escape(view)}"'
+                    cumulative = 0
+                    for bound, count in zip((*buckets, '+Inf'), counts):
+                        cumulative += count
+                        lines.append(
+                            f'{name}_bucket{{{label},le="{bound}"}} '
+                            f'{cumulative}')
+                    lines += [f'{name}_sum{{{label}}} {total}',
+                              f'{name}_count{{{label}}} {cumulative}']
+            lines += [f'# HELP {REQUESTS_TOTAL} Число ответов',
+                      f'# TYPE {REQUESTS_TOTAL} counter']
+            for (view, status_code), count in sorted(self.responses.items()):
+                lines.append(
+                    f'{REQUESTS_TOTAL}{{view="{escape(view)}",'
+                    f'status="{status_code}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def escape(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def view_name(request):
+    """
+    Имя представления: «класс.действие» для наборов представлений,
+    «класс.метод» для APIView, имя функции для прочих.
+    """
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    method = request.method.lower()
+    actions = getattr(func, 'actions', None)
+    if actions:
+        return f'{func.cls.__name__}.{actions.get(method, method)}'
+    view_class = getattr(func, 'view_class', None)
+    if view_class is None:
+        return func.__name__
+    if view_class.__qualname__ != view_class.__name__:
+        # Функция с @api_view: класс WrappedAPIView получает её имя.
+        return view_class.__name__
+    return f'{view_class.__name__}.{method}'
+
+
+def record_sql(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql += time.perf_counter() - started
+        metrics.queries += 1
+
+
+def add_sql_timer(sender, connection, **kwargs):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+@contextmanager
+def serializer_timer():
+    """
+    Время блока входит в замер сериализации текущего запроса.
+    Вложенные блоки входят во время внешнего и отдельно не считаются.
+    """
+    metrics = _current.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer += time.perf_counter() - started
+        metrics.serializing = False
+
+
+class TimedSerializerMixin:
+    """
+    Сериализатор, чьё to_representation входит в замер сериализации.
+    Вне замеряемого запроса добавляет только чтение ContextVar.
+    """
+
+    def to_representation(self, instance):
+        metrics = _current.get()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+def install():
+    """ Подключает замер SQL-запросов; повторно — ничего. """
+    connection_created.connect(
+        add_sql_timer, dispatch_uid='foodgram.metrics.sql')
+    for connection in connections.all(initialized_only=True):
+        add_sql_timer(None, connection)
+
+
+def show_server_timing(request):
+    if settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+class RequestMetricsMiddleware:
+    """
+    Замеряет запрос и записывает результат в гистограммы.
+    Стоит первым, чтобы общее время включало остальные промежуточные
+    слои; тело потоковых ответов формируется позже и не учитывается.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS:
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        started = time.perf_counter()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        view = self.observe(request, response, metrics, started)
+        if show_server_timing(request):
+            response['Server-Timing'] = metrics.server_timing(view)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        started = time.perf_counter()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        view = self.observe(request, response, metrics, started)
+        # Пользователь из сессии загружается из базы данных синхронно.
+        if await sync_to_async(show_server_timing)(request):
+            response['Server-Timing'] = metrics.server_timing(view)
+        return response
+
+    def observe(self, request, response, metrics, started):
+        metrics.total = time.perf_counter() - started
+        view = view_name(request)
+        registry.observe(view, response.status_code, metrics)
+        return view
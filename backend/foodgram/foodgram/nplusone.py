@@ -0,0 +1,193 @@
+"""
+Поиск N+1. Каждый SQL-запрос приводится к отпечатку — тексту без
+значений и с единым видом списков параметров, — и повторы одного
+отпечатка за запрос к API считаются. Если отпечаток повторился больше
+NPLUSONE_THRESHOLD раз, в отчёт попадают запрос, поле сериализатора
+и строка кода проекта, из которых он выполнен.
+
+NPLUSONE_DETECTION: '' — выключено (промежуточный слой отключается
+при запуске), 'log' — предупреждение в журнал foodgram.nplusone для
+доли NPLUSONE_SAMPLE_RATE запросов, 'raise' — исключение
+RepeatedQueriesError на каждом запросе (для тестов).
+"""
+import logging
+import os
+import random
+import re
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import view_name
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_SQL = re.compile(
+    r'^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE SAVEPOINT)\b', re.I)
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+LISTS = re.compile(r'\(\?(?:\s*,\s*\?)*\)')
+REPEATS = re.compile(r'(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+')
+SPACES = re.compile(r'\s+')
+# Код самого пакета foodgram (обёртки запросов, маршрутизатор)
+# источником запросов не считается.
+INFRASTRUCTURE_DIR = os.path.dirname(os.path.abspath(__file__))
+DRF_SERIALIZERS = os.path.join('rest_framework', 'serializers.py')
+
+_current = ContextVar('query_tracker', default=None)
+
+
+class RepeatedQueriesError(Exception):
+    """ Повторяющиеся запросы в режиме NPLUSONE_DETECTION = 'raise'. """
+
+
+def fingerprint(sql):
+    """
+    Отпечаток запроса: значения заменены на ?, списки значений
+    в IN и VALUES любой длины — на (...).
+    """
+    sql = LITERALS.sub('?', sql)
+    sql = REPEATS.sub(r'\1', LISTS.sub('(...)', sql))
+    return SPACES.sub(' ', sql).strip()
+
+
+def find_origin(frame):
+    """
+    Поле сериализатора, при выводе которого выполнен запрос, и ближайшая
+    к запросу строка кода проекта.
+    """
+    field = line = None
+    while frame is not None and (field is None or line is None):
+        code = frame.f_code
+        filename = code.co_filename
+        if (field is None and code.co_name == 'to_representation'
+                and filename.endswith(DRF_SERIALIZERS)
+                and 'field' in frame.f_locals):
+            serializer = type(frame.f_locals['self']).__name__
+            field = f"{serializer}.{frame.f_locals['field'].field_name}"
+        if (line is None and filename.startswith(settings.BASE_DIR)
+                and not filename.startswith(INFRASTRUCTURE_DIR)
+                and 'site-packages' not in filename):
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            line = f'{path}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return field, line
+
+
+class QueryTracker:
+    """ Счётчики отпечатков запросов одного запроса к API. """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.counts = {}
+        self.origins = {}
+
+    def record(self, sql):
+        if TRANSACTION_SQL.match(sql):
+            return
+        key = fingerprint(sql)
+        count = self.counts.get(key, 0) + 1
+        self.counts[key] = count
+        if count == self.threshold + 1:
+            self.origins[key] = find_origin(sys._getframe(2))
+
+    def repeated(self):
+        return [(key, count) for key, count in self.counts.items()
+                if count > self.threshold]
+
+    def report(self, title):
+        lines = [f'{title}: повторяющиеся запросы']
+        for key, count in self.repeated():
+            field, line = self.origins[key]
+            origin = ', '.join(filter(None, (
+                field and f'поле {field}', line))) or 'источник не найден'
+            lines += [f'  {count} раз: {key}', f'    {origin}']
+        return '\n'.join(lines)
+
+
+def record_query(execute, sql, params, many, context):
+    tracker = _current.get()
+    if tracker is not None:
+        tracker.record(sql)
+    return execute(sql, params, many, context)
+
+
+def add_query_tracker(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def install():
+    connection_created.connect(
+        add_query_tracker, dispatch_uid='foodgram.nplusone.queries')
+    for connection in connections.all(initialized_only=True):
+        add_query_tracker(None, connection)
+
+
+@contextmanager
+def track_queries(threshold=None):
+    """ Считает отпечатки запросов, выполненных внутри блока. """
+    install()
+    if threshold is None:
+        threshold = settings.NPLUSONE_THRESHOLD
+    tracker = QueryTracker(threshold)
+    token = _current.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current.reset(token)
+
+
+class RepeatedQueriesMiddleware:
+    """
+    Проверяет запросы к API на N+1. Запросы, выполненные при отдаче
+    тела потокового ответа, не учитываются.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.NPLUSONE_DETECTION:
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def sampled():
+        return (settings.NPLUSONE_DETECTION == 'raise'
+                or random.random() < settings.NPLUSONE_SAMPLE_RATE)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        with track_queries() as tracker:
+            response = self.get_response(request)
+        self.check(request, tracker)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        with track_queries() as tracker:
+            response = await self.get_response(request)
+        self.check(request, tracker)
+        return response
+
+    def check(self, request, tracker):
+        if not tracker.repeated():
+            return
+        report = tracker.report(
+            f'{view_name(request)} ({request.method} {request.path})')
+        if settings.NPLUSONE_DETECTION == 'raise':
+            raise RepeatedQueriesError(report)
+        logger.warning(report)
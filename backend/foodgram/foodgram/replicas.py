@@ -0,0 +1,128 @@
+import hashlib
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.authtoken.models import Token
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'db_sticky'
+
+# Можно ли читать с реплики в текущем запросе. Вне запросов
+# (команды, фоновые потоки) значение по умолчанию направляет всё в default.
+_read_replica = ContextVar('read_replica', default=False)
+
+
+def get_replicas():
+    return [alias for alias in settings.DATABASES if alias != 'default']
+
+
+def has_sticky_cookie(request):
+    return request.get_signed_cookie(
+        STICKY_COOKIE, default=None, salt=STICKY_COOKIE,
+        max_age=settings.REPLICA_STICKY_SECONDS) is not None
+
+
+def set_sticky_cookie(response):
+    response.set_signed_cookie(
+        STICKY_COOKIE, '1', salt=STICKY_COOKIE,
+        max_age=settings.REPLICA_STICKY_SECONDS, httponly=True,
+        samesite='Lax', secure=settings.SESSION_COOKIE_SECURE)
+
+
+def sticky_key(request):
+    """ Клиент запроса: токен или сессия, для анонимов — адрес. """
+    client = (request.META.get('HTTP_AUTHORIZATION')
+              or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+              or request.META.get('REMOTE_ADDR', ''))
+    return f'db_sticky:{hashlib.md5(client.encode()).hexdigest()}'
+
+
+class ReplicaRouter:
+    """
+    Чтение безопасных запросов — с одной из реплик, запись и всё,
+    что выполняется внутри транзакции, — в default. Токены всегда
+    читаются из default: только что выданный токен мог ещё
+    не дойти до реплики.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (_read_replica.get() and model is not Token
+                and not connections['default'].in_atomic_block):
+            replicas = get_replicas()
+            if replicas:
+                return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _read_replica.set(False)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaMiddleware:
+    """
+    Включает чтение с реплик для GET, HEAD и OPTIONS.
+    После изменяющего запроса клиент REPLICA_STICKY_SECONDS секунд
+    читает из default и видит собственные изменения. Отметка об этом
+    приходит клиенту в подписанной cookie и потому видна любому
+    процессу; при SHARED_CACHE она ещё и хранится в общем кэше
+    для клиентов, которые не сохраняют cookie.
+    Работает и в синхронном (WSGI), и в асинхронном (ASGI) стеке.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not get_replicas():
+            return self.get_response(request)
+        safe = request.method in SAFE_METHODS
+        shared = settings.SHARED_CACHE
+        key = sticky_key(request) if shared else None
+        sticky = safe and (has_sticky_cookie(request)
+                           or shared and cache.get(key))
+        token = _read_replica.set(safe and not sticky)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_replica.reset(token)
+        if not safe:
+            set_sticky_cookie(response)
+            if shared:
+                cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        if not get_replicas():
+            return await self.get_response(request)
+        safe = request.method in SAFE_METHODS
+        shared = settings.SHARED_CACHE
+        key = sticky_key(request) if shared else None
+        sticky = safe and (has_sticky_cookie(request)
+                           or shared and await cache.aget(key))
+        token = _read_replica.set(safe and not sticky)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_replica.reset(token)
+        if not safe:
+            set_sticky_cookie(response)
+            if shared:
+                await cache.aset(key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
@@ -52,7 +52,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.metrics.RequestMetricsMiddleware',
+    'foodgram.nplusone.RepeatedQueriesMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'foodgram.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -96,6 +99,43 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: DB_REPLICAS — хосты через запятую
+# (для SQLite — пути к файлам), см. foodgram.replicas.
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', default='').split(','))
+):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        ('NAME' if 'sqlite3' in DATABASES['default']['ENGINE']
+         else 'HOST'): replica.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['foodgram.replicas.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', default=10))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+# Виден ли кэш всем процессам (Redis, Memcached, база данных, файлы).
+# На нём держатся версии токенов, справочников и отметка недавней записи;
+# с кэшем в памяти процесса кэш токенов выключен, а справочники хранятся
+# не дольше CATALOG_LOCAL_TIMEOUT секунд. Для одного процесса (runserver)
+# можно задать SHARED_CACHE=True.
+SHARED_CACHE = os.getenv('SHARED_CACHE', default=str(
+    CACHES['default']['BACKEND'] not in (
+        'django.core.cache.backends.locmem.LocMemCache',
+        'django.core.cache.backends.dummy.DummyCache',
+    )
+)) == 'True'
+CATALOG_LOCAL_TIMEOUT = int(os.getenv('CATALOG_LOCAL_TIMEOUT', default=60))
+
 AUTH_USER_MODEL = 'users.FoodgramUser'
 
 # Password validation
@@ -121,7 +161,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
 }
 
@@ -161,4 +201,30 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', default=2))
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=1024))
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', default=60))
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED', default='') == 'True'
+
+# Асинхронные представления api.async_views, включаются в foodgram.asgi.
+ASYNC_API = os.getenv('ASYNC_API', default='') == 'True'
+
+# Замеры запросов, Server-Timing и /api/metrics/, см. foodgram.metrics.
+REQUEST_METRICS = os.getenv('REQUEST_METRICS', default='') == 'True'
+
+# Поиск N+1, см. foodgram.nplusone: '' (выключен), 'log' или 'raise'.
+NPLUSONE_DETECTION = os.getenv(
+    'NPLUSONE_DETECTION', default='log' if DEBUG else '')
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', default=5))
+NPLUSONE_SAMPLE_RATE = float(os.getenv('NPLUSONE_SAMPLE_RATE', default=1))
+
+# Ответы рецептов и подписок без сериализаторов DRF, см. api.representations.
+FAST_SERIALIZATION = os.getenv('FAST_SERIALIZATION', default='True') == 'True'
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 
@@ -8,18 +8,14 @@ class IngredientsInLine(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ['id', 'name', 'author', 'favorites']
+    list_display = ['id', 'name', 'author', 'favorites_count']
     search_fields = ['name', 'author__username']
     list_filter = ['tags']
+    list_select_related = ['author']
     inlines = (
         IngredientsInLine,
     )
 
-    def favorites(self, obj):
-        if Favorite.objects.filter(recipe=obj).exists():
-            return Favorite.objects.filter(recipe=obj).count()
-        return 0
-
 
 
 @admin.register(Ingredient)
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'catalog_version'
+
+
+def get_catalog_version():
+    """ Текущая версия справочников тегов и ингредиентов. """
+    return cache.get_or_set(CATALOG_VERSION_KEY, time.time_ns, timeout=None)
+
+
+def bump_catalog_version():
+    """
+    Помечает закэшированные справочники как устаревшие. Версия — время
+    изменения: после очистки кэша она не совпадёт с версией индексов
+    в памяти процессов (api.indexes), построенных по прежним данным.
+    """
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def catalog_cache_timeout(timeout=None):
+    """
+    Время жизни кэша справочников: ответов CatalogCacheMixin и индексов
+    api.indexes. Смену версии другим процессом кэш этого процесса
+    не видит, поэтому без SHARED_CACHE справочники хранятся не дольше
+    CATALOG_LOCAL_TIMEOUT секунд. Сама версия не истекает: она входит
+    и в ключи кэша анонимных ответов и ETag рецептов.
+    """
+    if settings.SHARED_CACHE:
+        return timeout
+    if timeout is None:
+        return settings.CATALOG_LOCAL_TIMEOUT
+    return min(timeout, settings.CATALOG_LOCAL_TIMEOUT)
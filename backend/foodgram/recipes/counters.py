@@ -0,0 +1,32 @@
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Favorite, Recipe
+
+
+def count(model, field):
+    """ Подзапрос с числом строк model, ссылающихся на внешний объект. """
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(count=Count('id')).values('count')
+    ), 0)
+
+
+def update_favorites_count(recipe_ids):
+    """
+    Пересчёт счётчика избранного одним UPDATE — для пакетных изменений,
+    при которых сигналы по отдельным строкам не отправляются.
+    """
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        favorites_count=count(Favorite, 'recipe'))
+
+
+class BatchDeletion:
+    """
+    Источник (origin) пакетного удаления отметок. Сигналы post_delete
+    приходят на каждую строку, но счётчики и версию отметок не меняют:
+    их один раз обновляет удаляющий код (api.toggles.remove_recipes).
+    """
+
+    def __init__(self, queryset):
+        self.queryset = queryset
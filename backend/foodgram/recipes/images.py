@@ -0,0 +1,107 @@
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+# Имя варианта: (наибольшая сторона в пикселях, формат, расширение).
+IMAGE_VARIANTS = {
+    'card': (480, 'JPEG', 'jpg'),
+    'detail': (1280, 'JPEG', 'jpg'),
+    'webp': (1280, 'WEBP', 'webp'),
+}
+VARIANTS_DIR = 'recipes/variants'
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS,
+            thread_name_prefix='recipe-images'
+        )
+    return _executor
+
+
+def log_failure(recipe_id, future):
+    """ Записывает в журнал ошибку генерации копий; рецепт их не получит. """
+    exception = future.exception()
+    if exception is not None:
+        logger.error('Не удалось создать копии изображения рецепта %s',
+                     recipe_id, exc_info=exception)
+
+
+def schedule_image_variants(recipe_id):
+    """
+    Ставит генерацию уменьшенных копий в очередь после фиксации транзакции.
+    При IMAGE_VARIANT_WORKERS = 0 копии создаются сразу, в текущем потоке.
+    Ошибки генерации записываются в журнал, рецепт остаётся с оригиналом.
+    """
+    def submit():
+        if settings.IMAGE_VARIANT_WORKERS:
+            future = get_executor().submit(build_image_variants, recipe_id)
+            future.add_done_callback(functools.partial(log_failure, recipe_id))
+            return
+        try:
+            build_image_variants(recipe_id)
+        except Exception:
+            logger.exception('Не удалось создать копии изображения рецепта %s',
+                             recipe_id)
+    transaction.on_commit(submit)
+
+
+def resize(image, size, image_format):
+    image = image.copy()
+    image.thumbnail((size, size), Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=85)
+    return ContentFile(buffer.getvalue())
+
+
+def build_image_variants(recipe_id):
+    """ Создаёт копии изображения рецепта и записывает их пути в рецепт. """
+    from .models import Recipe
+    from .versions import invalidate_recipes
+
+    try:
+        recipe = Recipe.objects.filter(pk=recipe_id).only(
+            'image', 'image_variants').first()
+        if recipe is None or not recipe.image:
+            return
+        source = recipe.image.name
+        if recipe.image_variants.get('source') == source:
+            return
+        with recipe.image.open('rb') as file:
+            image = ImageOps.exif_transpose(Image.open(file))
+            image.load()
+        stem = os.path.splitext(os.path.basename(source))[0]
+        variants = {'source': source}
+        for name, (size, image_format, extension) in IMAGE_VARIANTS.items():
+            variants[name] = default_storage.save(
+                f'{VARIANTS_DIR}/{stem}_{name}.{extension}',
+                resize(image, size, image_format)
+            )
+        updated = Recipe.objects.filter(pk=recipe_id, image=source).update(
+            image_variants=variants, updated_at=timezone.now())
+        if updated:
+            invalidate_recipes([recipe_id], touch=False)
+        stale = recipe.image_variants if updated else variants
+        for name in IMAGE_VARIANTS:
+            if stale.get(name):
+                default_storage.delete(stale[name])
+    finally:
+        if settings.IMAGE_VARIANT_WORKERS:
+            connections.close_all()
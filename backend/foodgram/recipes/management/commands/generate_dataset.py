@@ -0,0 +1,301 @@
+import csv
+import io
+import json
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Tag)
+from recipes.search import update_search_vector
+from recipes.tags import RecipeTags, tag_bit
+from recipes.versions import invalidate_recipes
+from users.models import FoodgramUser, Subscription
+
+DISHES = ('Суп', 'Салат', 'Пирог', 'Рагу', 'Омлет', 'Каша', 'Плов',
+          'Запеканка', 'Паста', 'Котлеты', 'Блины', 'Соус')
+ADJECTIVES = ('домашний', 'быстрый', 'летний', 'пряный', 'сытный',
+              'лёгкий', 'праздничный', 'постный', 'острый', 'нежный')
+PLACEHOLDER_SIZE = (1280, 960)
+PLACEHOLDER_DIR = 'recipes/generated'
+
+USER_FIELDS = ('id', 'email', 'username', 'first_name', 'last_name',
+               'password', 'is_superuser', 'is_staff', 'is_active',
+               'date_joined', 'recipes_count', 'subscribers_count')
+RECIPE_FIELDS = ('id', 'author_id', 'name', 'image', 'image_variants',
+                 'text', 'cooking_time', 'tag_mask', 'pub_date',
+                 'updated_at', 'favorites_count')
+
+
+def zipf_weights(rng, size, skew):
+    """
+    Накопленные веса степенного распределения: объект ранга r выбирается
+    с вероятностью, пропорциональной r ** -skew. Ранги перемешаны,
+    чтобы популярность не совпадала с порядком id.
+    """
+    ranks = list(range(1, size + 1))
+    rng.shuffle(ranks)
+    return list(accumulate(rank ** -skew for rank in ranks))
+
+
+def sample(rng, cum_weights, k, exclude=None):
+    """ До k различных индексов, выбранных по накопленным весам. """
+    population = range(len(cum_weights))
+    k = min(k, len(cum_weights) - (exclude is not None))
+    chosen = {}
+    for _ in range(5):
+        if len(chosen) >= k:
+            break
+        for index in rng.choices(population, cum_weights=cum_weights,
+                                 k=2 * (k - len(chosen))):
+            if index != exclude:
+                chosen[index] = None
+    return list(chosen)[:k]
+
+
+def copy_rows(model, fields, rows):
+    """ Записывает строки одной командой COPY ... FROM STDIN (PostgreSQL). """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            json.dumps(value) if isinstance(value, dict) else value
+            for value in row
+        ])
+    buffer.seek(0)
+    columns = ', '.join(
+        connection.ops.quote_name(model._meta.get_field(field).column)
+        for field in fields
+    )
+    sql = (f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+           f'({columns}) FROM STDIN WITH (FORMAT csv)')
+    with connection.cursor() as cursor:
+        if hasattr(cursor.cursor, 'copy_expert'):
+            cursor.cursor.copy_expert(sql, buffer)
+        else:
+            with cursor.cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+class Command(BaseCommand):
+    help = ('Создаёт синтетические данные для нагрузочного тестирования: '
+            'пользователей, рецепты с тегами и ингредиентами, избранное, '
+            'корзину и подписки. Авторы, рецепты и ингредиенты выбираются '
+            'по степенному закону; при одинаковых параметрах и --seed '
+            'данные совпадают. Теги и ингредиенты должны быть загружены '
+            'заранее командой loadmodels.')
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0,
+                            help="random seed; also part of the e-mails")
+        parser.add_argument("--scale", type=float, default=1.0,
+                            help="multiplier for the number of users")
+        parser.add_argument("--users", type=int, default=10000,
+                            help="users at scale 1")
+        parser.add_argument("--recipes", type=float, default=5,
+                            help="recipes per user on average")
+        parser.add_argument("--ingredients", type=int, default=8,
+                            help="ingredients per recipe on average")
+        parser.add_argument("--favorites", type=float, default=25,
+                            help="favorites per user on average")
+        parser.add_argument("--cart", type=float, default=5,
+                            help="shopping cart recipes per user on average")
+        parser.add_argument("--subscriptions", type=float, default=15,
+                            help="subscriptions per user on average")
+        parser.add_argument("--skew", type=float, default=1.1,
+                            help="power-law exponent of popularity")
+        parser.add_argument("--images", type=int, default=8,
+                            help="number of placeholder images")
+        parser.add_argument("--password", type=str, default="foodgram",
+                            help="password of the generated users")
+        parser.add_argument("--batch-size", type=int, default=10000,
+                            help="rows per INSERT or COPY")
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        self.use_copy = connection.vendor == 'postgresql'
+        self.rng = rng = random.Random(options["seed"])
+        self.prefix = f'load{options["seed"]}'
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not tag_ids or not ingredient_ids:
+            raise CommandError(
+                'Сначала загрузите теги и ингредиенты командой loadmodels.')
+        if FoodgramUser.objects.filter(
+                email=f'{self.prefix}-0@example.com').exists():
+            raise CommandError(
+                f'Данные с --seed {options["seed"]} уже созданы.')
+
+        started = time.perf_counter()
+        users = max(2, round(options["users"] * options["scale"]))
+        authors = zipf_weights(rng, users, options["skew"])
+        recipe_authors = rng.choices(
+            range(users), cum_weights=authors,
+            k=round(users * options["recipes"]))
+        popularity = zipf_weights(rng, len(recipe_authors), options["skew"])
+        recipe_tags = [
+            sorted(rng.sample(tag_ids, rng.randint(1, min(3, len(tag_ids)))))
+            for _ in recipe_authors
+        ]
+        favorites = self.plan(users, popularity, options["favorites"])
+        cart = self.plan(users, popularity, options["cart"])
+        subscriptions = self.plan(
+            users, authors, options["subscriptions"], exclude_self=True)
+
+        with transaction.atomic():
+            first_user = self.next_id(FoodgramUser)
+            first_recipe = self.next_id(Recipe)
+            written = self.write(FoodgramUser, USER_FIELDS, self.users(
+                users, first_user, options["password"],
+                Counter(recipe_authors),
+                Counter(author for _, author in subscriptions)
+            ))
+            written += self.write(Recipe, RECIPE_FIELDS, self.recipes(
+                first_user, first_recipe, recipe_authors, recipe_tags,
+                Counter(recipe for _, recipe in favorites),
+                self.placeholders(options["images"])
+            ))
+            written += self.write(RecipeTags, ('recipe_id', 'tag_id'), (
+                (first_recipe + recipe, tag)
+                for recipe, tags in enumerate(recipe_tags) for tag in tags
+            ))
+            written += self.write(
+                IngredientAmount, ('recipe_id', 'ingredient_id', 'amount'),
+                self.ingredient_amounts(
+                    first_recipe, len(recipe_authors), ingredient_ids,
+                    options["ingredients"], options["skew"])
+            )
+            for model, pairs, field in (
+                (Favorite, favorites, 'recipe_id'),
+                (ShoppingCart, cart, 'recipe_id'),
+                (Subscription, subscriptions, 'author_id'),
+            ):
+                first = first_recipe if field == 'recipe_id' else first_user
+                written += self.write(model, ('user_id', field), (
+                    (first_user + user, first + target)
+                    for user, target in pairs
+                ))
+            if self.use_copy:
+                with connection.cursor() as cursor:
+                    for sql in connection.ops.sequence_reset_sql(
+                            no_style(), [FoodgramUser, Recipe]):
+                        cursor.execute(sql)
+            self.update_search_vectors(first_recipe, len(recipe_authors))
+            invalidate_recipes([], author_ids=())
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано строк: {written} за {elapsed:.1f} с '
+            f'({written / elapsed:.0f} строк/с).'
+        ))
+
+    def plan(self, users, cum_weights, mean, exclude_self=False):
+        """
+        Пары (пользователь, объект) по индексам: число объектов
+        у пользователя распределено экспоненциально со средним mean,
+        сами объекты выбираются по весам cum_weights.
+        """
+        pairs = []
+        for user in range(users):
+            k = round(self.rng.expovariate(1 / mean)) if mean else 0
+            pairs.extend((user, target) for target in sample(
+                self.rng, cum_weights, k, user if exclude_self else None))
+        return pairs
+
+    def next_id(self, model):
+        return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+    def users(self, count, first_id, password, recipes, subscribers):
+        password = make_password(password)
+        now = timezone.now()
+        for user in range(count):
+            name = f'{self.prefix}_{user}'
+            yield (first_id + user, f'{self.prefix}-{user}@example.com',
+                   name, 'Тест', name, password, False, False, True, now,
+                   recipes[user], subscribers[user])
+
+    def placeholders(self, count):
+        """
+        Несколько изображений-заглушек на все рецепты: Pillow вызывается
+        по разу на файл, а не на строку. Уменьшенные копии не создаются,
+        API отдаёт вместо них оригинал.
+        """
+        names = []
+        for number in range(max(1, count)):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            name = f'{PLACEHOLDER_DIR}/{self.prefix}_{number}.jpg'
+            if not default_storage.exists(name):
+                buffer = BytesIO()
+                Image.new('RGB', PLACEHOLDER_SIZE, color).save(
+                    buffer, 'JPEG', quality=85)
+                name = default_storage.save(
+                    name, ContentFile(buffer.getvalue()))
+            names.append(name)
+        return names
+
+    def recipes(self, first_user, first_id, authors, tags, favorites,
+                images):
+        # Даты публикации идут в прошлое с шагом в минуту. bulk_create
+        # заполняет pub_date и updated_at текущим временем, поэтому
+        # разнесённые даты получаются только при записи через COPY.
+        now = timezone.now()
+        for recipe, author in enumerate(authors):
+            dish = self.rng.choice(DISHES)
+            adjective = self.rng.choice(ADJECTIVES)
+            published = now - timedelta(minutes=len(authors) - recipe)
+            yield (
+                first_id + recipe, first_user + author,
+                f'{dish} {adjective} №{recipe}',
+                self.rng.choice(images), {},
+                f'{dish}: {adjective} вариант на каждый день.',
+                self.rng.randint(5, 180),
+                sum(tag_bit(tag) or 0 for tag in tags[recipe]),
+                published, published, favorites[recipe]
+            )
+
+    def ingredient_amounts(self, first_recipe, recipes, ingredient_ids,
+                           mean, skew):
+        popularity = zipf_weights(self.rng, len(ingredient_ids), skew)
+        for recipe in range(recipes):
+            k = self.rng.randint(max(1, mean // 2), max(1, mean * 3 // 2))
+            for index in sample(self.rng, popularity, k):
+                yield (first_recipe + recipe, ingredient_ids[index],
+                       self.rng.randint(1, 500))
+
+    def write(self, model, fields, rows):
+        """
+        Записывает строки пачками по batch_size: на PostgreSQL командой
+        COPY, на остальных СУБД через bulk_create. Сигналы не
+        отправляются, счётчики посчитаны заранее.
+        """
+        written = 0
+        rows = iter(rows)
+        while batch := list(islice(rows, self.batch_size)):
+            if self.use_copy:
+                copy_rows(model, fields, batch)
+            else:
+                model.objects.bulk_create(
+                    [model(**dict(zip(fields, row))) for row in batch])
+            written += len(batch)
+        self.stdout.write(f'{model.__name__}: {written}')
+        return written
+
+    def update_search_vectors(self, first_recipe, count):
+        """ Поисковые векторы новых рецептов, по диапазонам id. """
+        last = first_recipe + count
+        for start in range(first_recipe, last, self.batch_size):
+            update_search_vector(Recipe.objects.filter(
+                pk__gte=start, pk__lt=min(start + self.batch_size, last)))
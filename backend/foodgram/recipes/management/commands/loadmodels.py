@@ -1,35 +1,147 @@
+import csv
 import json
+import os
+from itertools import chain, islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from recipes.catalog import bump_catalog_version
 from recipes.models import Ingredient, Tag
 
+FIELDS = {
+    Tag: ('name', 'color', 'slug'),
+    Ingredient: ('name', 'measurement_unit'),
+}
+KEYS = {
+    Tag: ('slug',),
+    Ingredient: ('name', 'measurement_unit'),
+}
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """ Построчно разбирает JSON-массив объектов, не читая файл целиком. """
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer:
+        return
+    if buffer[0] != '[':
+        raise CommandError('Ожидался JSON-массив.')
+    position = 1
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer):
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                pass
+            else:
+                yield item
+                continue
+        chunk = file.read(chunk_size)
+        if not chunk:
+            raise CommandError('Неожиданный конец JSON-файла.')
+        buffer, position = buffer[position:] + chunk, 0
+
+
+def read_csv(file):
+    """ Строки CSV: name,measurement_unit или name,color,slug. """
+    for row in csv.reader(file):
+        if not row or row[0] == 'name':
+            continue
+        for fields in FIELDS.values():
+            if len(row) == len(fields):
+                yield dict(zip(fields, row))
+                break
+        else:
+            raise CommandError(f'Неизвестный формат строки: {row}')
+
 
 class Command(BaseCommand):
+    help = ('Загружает теги или ингредиенты из JSON- или CSV-файла. '
+            'С --sync приводит таблицу в соответствие с файлом: '
+            'записи, которых нет в файле, удаляются вместе с их строками '
+            'в составе рецептов и связями рецептов с тегами; сами рецепты '
+            'остаются.')
 
     def add_arguments(self, parser):
-        parser.add_argument("--path", type=str, help="file path")
+        parser.add_argument("--path", type=str, help="file path",
+                            required=True)
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="rows per INSERT")
+        parser.add_argument("--sync", action="store_true",
+                            help="insert missing and delete absent rows "
+                                 "in one transaction; recipes keep existing "
+                                 "but lose the deleted ingredients and tags")
 
     def handle(self, *args, **options):
         file_path = options["path"]
+        self.batch_size = options["batch_size"]
+
+        with open(file_path, encoding='utf-8', newline='') as f:
+            if os.path.splitext(file_path)[1].lower() == '.csv':
+                rows = read_csv(f)
+            else:
+                rows = read_json(f)
+            first = next(rows, None)
+            if first is None:
+                self.stdout.write('Файл не содержит данных.')
+                return
+            model = Tag if 'color' in first else Ingredient
+            rows = chain([first], rows)
+            if options["sync"]:
+                with transaction.atomic():
+                    created, deleted = self.sync(model, rows)
+            else:
+                created, deleted = self.load(model, rows), 0
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'{model.__name__}: добавлено {created}, удалено {deleted}.'
+        ))
+
+    def objects(self, model, rows):
+        fields = FIELDS[model]
+        for row in rows:
+            yield model(**{field: row[field] for field in fields})
+
+    def insert(self, model, objects):
+        """ Вставляет объекты пачками, пропуская уже существующие. """
+        processed = 0
+        objects = iter(objects)
+        while batch := list(islice(objects, self.batch_size)):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            processed += len(batch)
+            self.stdout.write(f'{model.__name__}: обработано {processed}')
+
+    def load(self, model, rows):
+        before = model.objects.count()
+        self.insert(model, self.objects(model, rows))
+        return model.objects.count() - before
+
+    def sync(self, model, rows):
+        keys = KEYS[model]
+        existing = {
+            values[1:]: values[0]
+            for values in model.objects.values_list('id', *keys)
+        }
+        seen = set()
+
+        def missing():
+            for obj in self.objects(model, rows):
+                key = tuple(getattr(obj, field) for field in keys)
+                if key not in seen and key not in existing:
+                    yield obj
+                seen.add(key)
 
-        with open(file_path, encoding='utf-8') as f:
-            jsondata = json.load(f)
-            if 'color' in jsondata[0]:
-                for line in jsondata:
-                    if not Tag.objects.filter(
-                       slug=line['slug']).exists():
-                        Tag.objects.create(
-                            name=line['name'],
-                            color=line['color'],
-                            slug=line['slug'],
-                        )
-            elif 'measurement_unit' in jsondata[0]:
-                for line in jsondata:
-                    if not Ingredient.objects.filter(
-                       name=line['name'],
-                       measurement_unit=line['measurement_unit']).exists():
-                        Ingredient.objects.create(
-                            name=line['name'],
-                            measurement_unit=line['measurement_unit']
-                        )
+        before = model.objects.count()
+        self.insert(model, missing())
+        created = model.objects.count() - before
+        stale = [pk for key, pk in existing.items() if key not in seen]
+        for start in range(0, len(stale), self.batch_size):
+            model.objects.filter(
+                id__in=stale[start:start + self.batch_size]
+            ).delete()
+        return created, len(stale)
@@ -0,0 +1,50 @@
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from recipes.counters import count
+from recipes.models import Favorite, Recipe
+from users.models import Subscription
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, рецептов и подписчиков, '
+            'исправляя расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="rows per UPDATE")
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        recipes = self.recount(
+            Recipe, favorites_count=count(Favorite, 'recipe'))
+        users = self.recount(
+            User,
+            recipes_count=count(Recipe, 'author'),
+            subscribers_count=count(Subscription, 'author')
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено рецептов: {recipes}, пользователей: {users}.'
+        ))
+
+    def recount(self, model, **counters):
+        """ Обновляет счётчики пачками, трогая только расходящиеся строки. """
+        fixed = 0
+        ids = model.objects.order_by('pk').values_list('pk', flat=True)
+        ids = ids.iterator(chunk_size=self.batch_size)
+        while batch := list(islice(ids, self.batch_size)):
+            with transaction.atomic():
+                stale = model.objects.filter(pk__in=batch).alias(
+                    **{f'actual_{name}': value
+                       for name, value in counters.items()}
+                ).exclude(**{
+                    name: F(f'actual_{name}') for name in counters
+                })
+                fixed += stale.update(**counters)
+        return fixed
@@ -0,0 +1,89 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Value
+
+from users.models import Subscription
+
+from .models import Favorite, ShoppingCart
+
+MEMBERSHIP_TIMEOUT = 60 * 60
+
+
+class Membership:
+    """ Избранное, корзина и подписки пользователя в виде множеств id. """
+
+    def __init__(self, favorites=(), shopping_cart=(), subscriptions=()):
+        self.favorites = frozenset(favorites)
+        self.shopping_cart = frozenset(shopping_cart)
+        self.subscriptions = frozenset(subscriptions)
+
+    @classmethod
+    def load(cls, user_id):
+        """ Все три множества одним запросом UNION ALL. """
+        sets = ([], [], [])
+        rows = [
+            model.objects.filter(user_id=user_id).annotate(
+                kind=Value(kind)).values_list('kind', field)
+            for kind, (model, field) in enumerate((
+                (Favorite, 'recipe_id'),
+                (ShoppingCart, 'recipe_id'),
+                (Subscription, 'author_id'),
+            ))
+        ]
+        for kind, pk in rows[0].union(*rows[1:], all=True):
+            sets[kind].append(pk)
+        return cls(*sets)
+
+    def fingerprint(self):
+        """ Отпечаток множеств для ETag, одинаковый во всех процессах. """
+        content = repr((sorted(self.favorites), sorted(self.shopping_cart),
+                        sorted(self.subscriptions)))
+        return hashlib.md5(content.encode()).hexdigest()
+
+
+EMPTY_MEMBERSHIP = Membership()
+
+
+def get_membership_version(user_id):
+    return cache.get_or_set(
+        f'membership_version:{user_id}', time.time_ns, timeout=None)
+
+
+def bump_membership_version(user_id):
+    """
+    Помечает закэшированные множества пользователя как устаревшие
+    после фиксации транзакции. Версия — время изменения, поэтому
+    после вытеснения ключа из кэша она не совпадёт с прежними.
+    """
+    transaction.on_commit(lambda: cache.set(
+        f'membership_version:{user_id}', time.time_ns(), timeout=None))
+
+
+def get_membership(request):
+    """
+    Множества текущего пользователя: один раз за запрос, из общего кэша
+    по ключу пользователя и версии или из базы данных. Внутри транзакции
+    общий кэш не используется, чтобы видеть собственные изменения, а без
+    SHARED_CACHE — потому что версию, сменённую другим процессом, кэш
+    этого процесса не увидит.
+    """
+    if request is None or not request.user.is_authenticated:
+        return EMPTY_MEMBERSHIP
+    membership = getattr(request, '_membership', None)
+    if membership is not None:
+        return membership
+    user_id = request.user.pk
+    if connection.in_atomic_block or not settings.SHARED_CACHE:
+        membership = Membership.load(user_id)
+    else:
+        key = f'membership:{user_id}:{get_membership_version(user_id)}'
+        membership = cache.get(key)
+        if membership is None:
+            membership = Membership.load(user_id)
+            cache.set(key, membership, MEMBERSHIP_TIMEOUT)
+    request._membership = membership
+    return membership
@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-18 05:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_favorites(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    favorites = Favorite.objects.filter(
+        recipe=OuterRef('pk')
+    ).values('recipe').annotate(count=Count('id')).values('count')
+    Recipe.objects.update(favorites_count=Coalesce(Subquery(favorites), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_pub_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(count_favorites, migrations.RunPython.noop),
+    ]
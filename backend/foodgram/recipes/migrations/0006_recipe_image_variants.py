@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Уменьшенные копии изображения'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2 on 2026-10-18 05:43
+
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import F, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+INDEX_NAME = 'recipe_search_vector_idx'
+
+
+def is_postgresql(schema_editor):
+    return schema_editor.connection.vendor == 'postgresql'
+
+
+def create_search_index(apps, schema_editor):
+    """ Индекс GIN и вектор существующих рецептов — только на PostgreSQL. """
+    if not is_postgresql(schema_editor):
+        return
+    schema_editor.execute(
+        f'CREATE INDEX {INDEX_NAME} ON recipes_recipe '
+        f'USING gin (search_vector)'
+    )
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    ingredients = IngredientAmount.objects.filter(
+        recipe=OuterRef('pk')
+    ).values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    Recipe.objects.update(search_vector=(
+        SearchVector(F('name'), weight='A', config='russian')
+        + SearchVector(F('text'), weight='B', config='russian')
+        + SearchVector(Coalesce(Subquery(ingredients), Value(''),
+                                output_field=TextField()),
+                       weight='C', config='russian')
+    ))
+
+
+def drop_search_index(apps, schema_editor):
+    if is_postgresql(schema_editor):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
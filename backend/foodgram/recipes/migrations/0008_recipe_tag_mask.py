@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-18 05:45
+
+from django.db import migrations, models
+
+
+def fill_tag_masks(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    masks = {}
+    for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+        'recipe_id', 'tag_id'
+    ):
+        if 0 < tag_id <= 63:
+            masks[recipe_id] = masks.get(recipe_id, 0) | 1 << (tag_id - 1)
+    Recipe.objects.bulk_update(
+        [Recipe(pk=pk, tag_mask=mask) for pk, mask in masks.items()],
+        ['tag_mask'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.RunPython(fill_tag_masks, migrations.RunPython.noop),
+    ]
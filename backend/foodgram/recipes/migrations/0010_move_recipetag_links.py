@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+def move_recipe_tags(apps, schema_editor):
+    """
+    Связи, записанные API в RecipeTag, переносятся в Recipe.tags,
+    а маски тегов пересчитываются по полному набору связей.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeTag = apps.get_model('recipes', 'RecipeTag')
+    RecipeTags = Recipe.tags.through
+    RecipeTags.objects.bulk_create(
+        (RecipeTags(recipe_id=recipe_id, tag_id=tag_id)
+         for recipe_id, tag_id in RecipeTag.objects.values_list(
+             'recipe_id', 'tag_id').iterator()),
+        batch_size=1000, ignore_conflicts=True
+    )
+    masks = dict.fromkeys(Recipe.objects.values_list('pk', flat=True), 0)
+    for recipe_id, tag_id in RecipeTags.objects.values_list(
+        'recipe_id', 'tag_id'
+    ):
+        if 0 < tag_id <= 63:
+            masks[recipe_id] |= 1 << (tag_id - 1)
+    Recipe.objects.bulk_update(
+        [Recipe(pk=pk, tag_mask=mask) for pk, mask in masks.items()],
+        ['tag_mask'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_recipe_tags, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='RecipeTag',
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.contrib.auth import get_user_model
@@ -46,6 +47,11 @@ class Recipe(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recipes')
     name = models.CharField(max_length=200)
     image = models.ImageField(upload_to='recipes/')
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        blank=True
+    )
     text = models.TextField()
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -53,12 +59,40 @@ class Recipe(models.Model):
         verbose_name='Ингредиенты',
     )
     tags = models.ManyToManyField('Tag', related_name='recipes')
+    tag_mask = models.BigIntegerField(
+        verbose_name='Маска тегов',
+        default=0,
+        editable=False
+    )
     cooking_time = models.PositiveIntegerField(
         verbose_name='Время приготовления',
         validators=[MinValueValidator(
             1, message='Время приготовления должно быть не менее 1 минуты!'
         )]
     )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+        auto_now_add=True
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -95,23 +129,6 @@ class Favorite(models.Model):
         return f'{self.recipe.name} - {self.user.username}'
 
 
-class RecipeTag(models.Model):
-    """ Модель связи тега и рецепта. """
-
-    recipe = models.ForeignKey(
-        Recipe,
-        on_delete=models.CASCADE,
-        verbose_name='Рецепт'
-    )
-    tag = models.ForeignKey(
-        Tag,
-        on_delete=models.CASCADE,
-        verbose_name='Тег'
-    )
-
-    class Meta:
-        unique_together = ('recipe', 'tag',)
-
 class ShoppingCart(models.Model):
     user = models.ForeignKey(
         User,
@@ -0,0 +1,92 @@
+from functools import reduce
+from operator import add, and_, or_
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections
+from django.db.models import (Case, Exists, F, FloatField, OuterRef, Q,
+                              Subquery, TextField, Value, When)
+from django.db.models.functions import Coalesce
+
+from .models import IngredientAmount, Recipe
+
+SEARCH_CONFIG = 'russian'
+# Веса полей: название, описание, ингредиенты. Совпадают со значениями
+# ts_rank по умолчанию для весов A, B и C.
+SEARCH_WEIGHTS = (('name', 'A', 1.0), ('text', 'B', 0.4),
+                  ('ingredients', 'C', 0.2))
+SEARCH_ORDERING = ('-rank', '-pub_date', '-id')
+
+
+def is_postgresql(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def search_vector_expression():
+    ingredients = IngredientAmount.objects.filter(
+        recipe=OuterRef('pk')
+    ).values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    fields = {
+        'name': F('name'),
+        'text': F('text'),
+        'ingredients': Coalesce(
+            Subquery(ingredients), Value(''), output_field=TextField()),
+    }
+    return reduce(add, (
+        SearchVector(fields[field], weight=weight, config=SEARCH_CONFIG)
+        for field, weight, _ in SEARCH_WEIGHTS
+    ))
+
+
+def update_search_vector(queryset):
+    """
+    Пересчитывает поисковый вектор рецептов одним UPDATE.
+    На других СУБД вектор не используется и не хранится.
+    """
+    if is_postgresql(queryset):
+        queryset.update(search_vector=search_vector_expression())
+
+
+def update_recipe_search_vector(recipe_ids):
+    update_search_vector(Recipe.objects.filter(pk__in=recipe_ids))
+
+
+def search_recipes(queryset, text):
+    """
+    Рецепты, подходящие под поисковую строку, по убыванию релевантности.
+    На PostgreSQL поиск идёт по индексу GIN на search_vector,
+    на остальных СУБД — по вхождению каждого слова в название,
+    описание или ингредиенты с теми же весами полей.
+    """
+    if is_postgresql(queryset):
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type='websearch')
+        queryset = queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query))
+    else:
+        terms = text.split()
+        if not terms:
+            return queryset.none()
+        matches = [
+            {
+                'name': Q(name__icontains=term),
+                'text': Q(text__icontains=term),
+                'ingredients': Exists(IngredientAmount.objects.filter(
+                    recipe=OuterRef('pk'), ingredient__name__icontains=term
+                )),
+            }
+            for term in terms
+        ]
+        queryset = queryset.filter(reduce(and_, (
+            reduce(or_, match.values())
+            for match in matches
+        ))).annotate(rank=reduce(add, (
+            Case(When(match[field], then=Value(weight)),
+                 default=Value(0.0), output_field=FloatField())
+            for match in matches
+            for field, _, weight in SEARCH_WEIGHTS
+        )))
+    return queryset.order_by(*SEARCH_ORDERING)
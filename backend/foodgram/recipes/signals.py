@@ -0,0 +1,152 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.functions import Greatest
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .counters import BatchDeletion
+from .images import schedule_image_variants
+from .membership import bump_membership_version
+from .models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                     ShoppingCart, Tag)
+from .search import update_recipe_search_vector, update_search_vector
+from .tags import RecipeTags, clear_tag_bit, update_tag_masks
+from .versions import invalidate_recipes
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def catalog_item_changed(sender, instance, created=False, **kwargs):
+    # Названия тегов и ингредиентов входят в ответы рецептов: у рецептов
+    # меняются updated_at и версии, как при изменении их самих.
+    if created:
+        return
+    field = 'tags' if sender is Tag else 'ingredients'
+    invalidate_recipes(Recipe.objects.filter(
+        **{field: instance}).values_list('pk', flat=True).distinct())
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    clear_tag_bit(instance.pk)
+
+
+@receiver(m2m_changed, sender=RecipeTags)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        # Маска и в самом объекте: иначе последующий instance.save()
+        # (CreateRecipeSerializer.update) запишет прежнее значение.
+        instance.tag_mask = update_tag_masks([instance.pk])[instance.pk]
+        invalidate_recipes([instance.pk])
+    elif action == 'post_clear':
+        clear_tag_bit(instance.pk)
+        bump_catalog_version()
+    else:
+        update_tag_masks(pk_set)
+        invalidate_recipes(pk_set)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, BatchDeletion):
+        return
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        favorites_count=Greatest(F('favorites_count') - 1, 0)
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def membership_changed(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, BatchDeletion):
+        return
+    bump_membership_version(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    source = instance.image_variants.get('source')
+    if instance.image and instance.image.name != source:
+        schedule_image_variants(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_search_saved(sender, instance, **kwargs):
+    # Ингредиенты записываются после рецепта в той же транзакции.
+    transaction.on_commit(
+        partial(update_recipe_search_vector, [instance.pk]))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_search_saved(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(partial(
+            update_search_vector,
+            Recipe.objects.filter(ingredients=instance)
+        ))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipes([instance.pk], [instance.author_id], touch=False)
+
+
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+def recipe_ingredients_changed(sender, instance, origin=None, **kwargs):
+    # API и админка сохраняют и сам рецепт, а с ним и список автора,
+    # поэтому здесь автор не запрашивается для каждой строки.
+    # Удаление queryset (разница состава в CreateRecipeSerializer.update)
+    # присылает сигнал на каждую строку; updated_at рецепта тогда
+    # обновляет один раз последующее сохранение рецепта (auto_now).
+    deleting_recipe = (isinstance(origin, Recipe)
+                       or getattr(origin, 'model', None) is Recipe)
+    if instance.recipe_id is not None and not deleting_recipe:
+        invalidate_recipes([instance.recipe_id], author_ids=(),
+                           touch=not isinstance(origin, QuerySet))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    User.objects.filter(pk=instance.author_id).update(
+        recipes_count=Greatest(F('recipes_count') - 1, 0)
+    )
@@ -0,0 +1,66 @@
+from django.db.models import Exists, F, OuterRef
+
+from .models import Recipe
+
+# Тег с id n занимает бит n - 1; старший бит BigIntegerField не используется,
+# чтобы маска оставалась положительной.
+TAG_MASK_BITS = 63
+
+RecipeTags = Recipe.tags.through
+
+
+def tag_bit(tag_id):
+    if 0 < tag_id <= TAG_MASK_BITS:
+        return 1 << (tag_id - 1)
+    return None
+
+
+def get_tag_mask(tag_ids):
+    """ Маска набора тегов или None, если какой-то тег не помещается в неё. """
+    mask = 0
+    for tag_id in tag_ids:
+        bit = tag_bit(tag_id)
+        if bit is None:
+            return None
+        mask |= bit
+    return mask
+
+
+def update_tag_masks(recipe_ids):
+    """ Пересчитывает tag_mask рецептов по их текущим тегам. """
+    masks = dict.fromkeys(recipe_ids, 0)
+    for recipe_id, tag_id in RecipeTags.objects.filter(
+        recipe_id__in=masks
+    ).values_list('recipe_id', 'tag_id'):
+        masks[recipe_id] |= tag_bit(tag_id) or 0
+    Recipe.objects.bulk_update(
+        [Recipe(pk=pk, tag_mask=mask) for pk, mask in masks.items()],
+        ['tag_mask']
+    )
+    return masks
+
+
+def clear_tag_bit(tag_id):
+    bit = tag_bit(tag_id)
+    if bit is not None:
+        Recipe.objects.alias(
+            tagged=F('tag_mask').bitand(bit)
+        ).filter(tagged__gt=0).update(tag_mask=F('tag_mask').bitand(~bit))
+
+
+def filter_by_tags(queryset, tag_ids):
+    """
+    Рецепты, у которых есть хотя бы один из тегов.
+    Проверка одной битовой операцией над tag_mask, без соединения
+    с таблицей связей и без повторяющихся строк. Отдельного индекса
+    у tag_mask нет: B-дерево не ищет по tag_mask & mask, а тегов мало,
+    и каждый есть у заметной доли рецептов — условие проверяется
+    при обходе recipe_pub_date_id_idx в порядке списка до LIMIT.
+    """
+    mask = get_tag_mask(tag_ids)
+    if mask is None:
+        return queryset.filter(Exists(RecipeTags.objects.filter(
+            recipe=OuterRef('pk'), tag_id__in=tag_ids)))
+    return queryset.alias(
+        tagged=F('tag_mask').bitand(mask)
+    ).filter(tagged__gt=0)
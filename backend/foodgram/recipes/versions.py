@@ -0,0 +1,51 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Recipe
+
+RECIPE_LIST_VERSION_KEY = 'recipes_version'
+
+
+def recipe_version_key(recipe_id):
+    return f'recipe_version:{recipe_id}'
+
+
+def author_version_key(author_id):
+    return f'author_recipes_version:{author_id}'
+
+
+def get_versions(keys):
+    """
+    Текущие версии данных для ключей ответа.
+    Версия — время последнего изменения; отсутствующие в кэше
+    получают новое значение и не совпадут ни с одной прежней.
+    """
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return tuple(versions[key] for key in keys)
+
+
+def invalidate_recipes(recipe_ids, author_ids=None, touch=True):
+    """
+    Отмечает изменение рецептов: обновляет их updated_at (если touch)
+    и после фиксации транзакции помечает устаревшими закэшированные
+    рецепты, списки их авторов и общий список рецептов.
+    """
+    recipe_ids = list(recipe_ids)
+    if touch:
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            updated_at=timezone.now())
+    if author_ids is None:
+        author_ids = Recipe.objects.filter(pk__in=recipe_ids).values_list(
+            'author_id', flat=True).distinct()
+    keys = [RECIPE_LIST_VERSION_KEY]
+    keys += [recipe_version_key(pk) for pk in recipe_ids]
+    keys += [author_version_key(pk) for pk in author_ids]
+    transaction.on_commit(lambda: cache.set_many(
+        dict.fromkeys(keys, time.time_ns()), timeout=None))
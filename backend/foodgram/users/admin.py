@@ -6,7 +6,14 @@ from .models import FoodgramUser, Subscription
 
 @admin.register(FoodgramUser)
 class FoodgramUserAdmin(admin.ModelAdmin):
-    list_display = ['username', 'email', 'first_name', 'last_name']
+    list_display = [
+        'username',
+        'email',
+        'first_name',
+        'last_name',
+        'recipes_count',
+        'subscribers_count'
+    ]
     search_fields = ['username', 'email']
     list_filter = ['username', 'email']
     ordering = ['username']
@@ -0,0 +1,96 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+
+def auth_version_key(user_id):
+    return f'auth_version:{user_id}'
+
+
+def get_auth_version(user_id):
+    return cache.get_or_set(auth_version_key(user_id), time.time_ns,
+                            timeout=None)
+
+
+def bump_auth_version(user_id):
+    """
+    После фиксации транзакции делает недействительными закэшированные
+    токены пользователя. Вместе с общим кэшем (Redis, Memcached)
+    изменение сразу видят все процессы.
+    """
+    transaction.on_commit(lambda: cache.set(
+        auth_version_key(user_id), time.time_ns(), timeout=None))
+
+
+class TokenCache:
+    """ Ограниченный по размеру LRU-кэш с временем жизни записей. """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE,
+                         settings.TOKEN_CACHE_TIMEOUT)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication без запроса к базе данных на каждый вызов API.
+    Пользователь и токен хранятся в LRU-кэше процесса, а при
+    TOKEN_CACHE_SHARED — ещё и в общем кэше Django. Запись действительна,
+    пока не сменилась версия пользователя: её обновляют выход из системы,
+    удаление токена и любое сохранение пользователя, в том числе
+    деактивация и смена пароля. Версия хранится в кэше Django, поэтому
+    без SHARED_CACHE отзыв токена не увидят другие процессы, и кэш
+    не используется.
+    """
+
+    def authenticate_credentials(self, key):
+        if not settings.SHARED_CACHE:
+            return super().authenticate_credentials(key)
+        entry = token_cache.get(key)
+        if entry is None and settings.TOKEN_CACHE_SHARED:
+            entry = cache.get(f'auth_token:{key}')
+            if entry is not None:
+                token_cache.set(key, entry)
+        if entry is not None:
+            user, token, version = entry
+            if version == get_auth_version(user.pk):
+                return copy.copy(user), token
+        user, token = super().authenticate_credentials(key)
+        entry = (user, token, get_auth_version(user.pk))
+        token_cache.set(key, entry)
+        if settings.TOKEN_CACHE_SHARED:
+            cache.set(f'auth_token:{key}', entry, settings.TOKEN_CACHE_TIMEOUT)
+        return copy.copy(user), token
@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-18 05:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_recipes_and_subscribers(apps, schema_editor):
+    FoodgramUser = apps.get_model('users', 'FoodgramUser')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscription = apps.get_model('users', 'Subscription')
+    recipes = Recipe.objects.filter(
+        author=OuterRef('pk')
+    ).values('author').annotate(count=Count('id')).values('count')
+    subscribers = Subscription.objects.filter(
+        author=OuterRef('pk')
+    ).values('author').annotate(count=Count('id')).values('count')
+    FoodgramUser.objects.update(
+        recipes_count=Coalesce(Subquery(recipes), 0),
+        subscribers_count=Coalesce(Subquery(subscribers), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_favorites_count'),
+        ('users', '0005_rename_user_foodgramuser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foodgramuser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Рецептов'),
+        ),
+        migrations.AddField(
+            model_name='foodgramuser',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Подписчиков'),
+        ),
+        migrations.RunPython(
+            count_recipes_and_subscribers, migrations.RunPython.noop
+        ),
+    ]
@@ -11,6 +11,8 @@ class FoodgramUser(AbstractUser):
         'Юзернейм',
         max_length=150,
         validators=[UnicodeUsernameValidator])
+    recipes_count = models.PositiveIntegerField('Рецептов', default=0)
+    subscribers_count = models.PositiveIntegerField('Подписчиков', default=0)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', 'password']
@@ -0,0 +1,55 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.membership import bump_membership_version
+from recipes.versions import invalidate_recipes
+
+from .authentication import bump_auth_version
+from .models import FoodgramUser, Subscription
+
+
+@receiver(post_save, sender=FoodgramUser)
+def user_saved(sender, instance, created, **kwargs):
+    if not created:
+        bump_auth_version(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    bump_auth_version(instance.user_id)
+
+
+# Поля пользователя, которые входят в ответы с рецептами.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=FoodgramUser)
+def author_saved(sender, instance, created, update_fields, **kwargs):
+    if created or (update_fields and not AUTHOR_FIELDS & update_fields):
+        return
+    invalidate_recipes(
+        instance.recipes.values_list('id', flat=True), [instance.pk])
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_created(sender, instance, created, **kwargs):
+    if created:
+        FoodgramUser.objects.filter(pk=instance.author_id).update(
+            subscribers_count=F('subscribers_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    FoodgramUser.objects.filter(pk=instance.author_id).update(
+        subscribers_count=Greatest(F('subscribers_count') - 1, 0)
+    )
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def subscriptions_changed(sender, instance, **kwargs):
+    bump_membership_version(instance.user_id)